@@ -2,9 +2,10 @@ import numpy as np
 import matplotlib.pyplot as plt
 import settings.settings as s
 import settings.tools as t
+import settings.store as st
+import settings.iset as iset
 import settings.prices as p
 import seaborn as sns
-from tqdm import tqdm
 from matplotlib import rcParams
 from matplotlib.offsetbox import AnchoredText
 rcParams.update({'figure.autolayout': True})
@@ -84,26 +85,26 @@ class LCOE_Objectives():
 
     # Loading the solved network and extracting the time series in unit of mean load. --------------
     def load_network(self):
-        self.EU = [np.load(s.iset_folder + s.iset_prefix + s.files[country]) for country in range(30)]
-        self.L_EU = np.array([n['L'] for n in self.EU])
+        self.L_EU = iset.get_all('L')
         self.L_DE = self.L_EU[18]
         self.avg_L_DE = np.mean(self.L_DE)
         self.avg_L_DE *= 1000
 
-        self.N = np.load(s.nodes_fullname_inf.format(f='s', c='c', a=self.alpha, g=self.gamma, b=np.inf))
-        self.B = self.N.f.balancing[18]
+        # Only the rows of DE are read from the store (or the file if it isn't in the store).
+        store = st.ScenarioStore()
+        scenario = dict(c='c', f='s', a=self.alpha, g=self.gamma, b=np.inf, country=18, store=store)
+        self.B = st.read_nodes('balancing', **scenario)
         self.B /= self.avg_L_DE
         # Backup capacities at 99, 99.9 and 99.99 % quantiles.
-        self.cap99 = t.quantile_old(0.99, self.B)
-        self.cap999 = t.quantile_old(0.999, self.B)
-        self.cap9999 = t.quantile_old(0.9999, self.B)
+        (self.cap99, self.cap999, self.cap9999) = t.quantiles((0.99, 0.999, 0.9999), self.B,
+                                                              method='histogram')
 
         self.B_99 = self.B.clip(max=self.cap99)
         self.B_999 = self.B.clip(max=self.cap999)
         self.B_9999 = self.B.clip(max=self.cap9999)
-        self.C = self.N.f.curtailment[18]
+        self.C = st.read_nodes('curtailment', **scenario)
         self.C /= self.avg_L_DE
-        self.nhours = self.N.f.nhours[18]
+        self.nhours = st.read_nodes('nhours', **scenario)
         self.tt = range(len(self.B))
 
     # Calculate storage and objectives -------------------------------------------------------------
@@ -126,6 +127,30 @@ class LCOE_Objectives():
 #         self.E_NS[np.abs(self.E_NS) < 1e-10] = 0
 #         self.E_NS_hours = np.count_nonzero(self.E_NS)
 
+    def calculate_storage_batch(self,
+                                KSE=np.inf,
+                                KSPc=np.inf,
+                                KSPd=np.inf,
+                                eta_in=1,
+                                eta_out=1,
+                                add_curtailment=False,
+                                ):
+        # Constrained storages for all the constraints, which can be arrays. Takes the same
+        # arguments as 'set_storage_constraints' but leaves the constraints of the object alone.
+        # Only the objectives are kept - the non-served energy is found against the unconstrained
+        # storage.
+        (self.S_max0, self.S0, self.Bs0) = t.storage_size(self.B, self.beta_b)
+        return(t.storage_size_batch(self.B, self.beta_b,
+                                    curtailment=self.C if add_curtailment else np.array(0),
+                                    eta_in=eta_in,
+                                    eta_out=eta_out,
+                                    charging_capacity=np.multiply(KSPc, eta_in),
+                                    discharging_capacity=np.divide(KSPd, eta_out),
+                                    energy_capacity=KSE,
+                                    return_timeseries=False,
+                                    S_reference=self.S0,
+                                    ))
+
     def calculate_E_NS(self):
         self.E_NS, self.E_NS_hours = t.get_non_served_storage_energy(self.S0, self.S1,
                 self.eta_in, self.eta_out)
@@ -524,24 +549,14 @@ class LCOE_Objectives():
     def capacity_test_KSE(self):
         colors = sns.color_palette()
         KSE_iter = np.linspace(7.0, 1.0, 61)
-        self.E_NS_list = np.empty_like(KSE_iter)
-        self.E_NS_hours_list = np.empty_like(KSE_iter)
-        for i, KSE in enumerate(tqdm(KSE_iter)):
-            self.set_storage_constraints(
-                                        KSE=KSE,
-                                        eta_in=p.prices_storage_bussar.EfficiencyCharge,
-                                        eta_out=p.prices_storage_bussar.EfficiencyDischarge,
-                                        add_curtailment=True,
-                                        )
-            self.calculate_storage()
-            self.get_objectives()
-            self.calculate_LCOE()
-            self.calculate_E_NS()
-            E_NS = np.sum(self.E_NS)
-            E_NS_hours = self.E_NS_hours
-
-            self.E_NS_list[i] = E_NS
-            self.E_NS_hours_list[i] = E_NS_hours
+        objectives = self.calculate_storage_batch(
+                                    KSE=KSE_iter,
+                                    eta_in=p.prices_storage_bussar.EfficiencyCharge,
+                                    eta_out=p.prices_storage_bussar.EfficiencyDischarge,
+                                    add_curtailment=True,
+                                    )
+        self.E_NS_list = objectives.E_NS
+        self.E_NS_hours_list = objectives.E_NS_hours
 
         fig1, (ax1) = plt.subplots(1, 1, figsize=s.figure_size)
         fig2, (ax2) = plt.subplots(1, 1, figsize=s.figure_size)
@@ -564,23 +579,13 @@ class LCOE_Objectives():
     def capacity_test_KSPd(self):
         colors = sns.color_palette()
         KSPd_iter = np.linspace(0.5, 0, 1001)
-        self.E_NS_list = np.empty_like(KSPd_iter)
-        self.E_NS_hours_list = np.empty_like(KSPd_iter)
-        for i, KSPd in enumerate(tqdm(KSPd_iter)):
-            self.set_storage_constraints(KSPd=KSPd,
-                                        eta_in=p.prices_storage_bussar.EfficiencyCharge,
-                                        eta_out=p.prices_storage_bussar.EfficiencyDischarge,
-                                        add_curtailment=True,
-                                        )
-            self.calculate_storage()
-            self.get_objectives()
-            self.calculate_LCOE()
-            self.calculate_E_NS()
-            E_NS = np.sum(self.E_NS)
-            E_NS_hours = self.E_NS_hours
-
-            self.E_NS_list[i] = E_NS
-            self.E_NS_hours_list[i] = E_NS_hours
+        objectives = self.calculate_storage_batch(KSPd=KSPd_iter,
+                                    eta_in=p.prices_storage_bussar.EfficiencyCharge,
+                                    eta_out=p.prices_storage_bussar.EfficiencyDischarge,
+                                    add_curtailment=True,
+                                    )
+        self.E_NS_list = objectives.E_NS
+        self.E_NS_hours_list = objectives.E_NS_hours
 
         fig1, (ax1) = plt.subplots(1, 1, figsize=s.figure_size)
         fig2, (ax2) = plt.subplots(1, 1, figsize=s.figure_size)
@@ -605,22 +610,20 @@ class LCOE_Objectives():
     def capacity_test_KSPc(self):
         colors = sns.color_palette()
         KSPc_iter = np.linspace(0.02, 0, 101)
-        self.BE_list = np.empty_like(KSPc_iter)
+        objectives = self.calculate_storage_batch(
+                                    KSPc=KSPc_iter,
+                                    KSPd=0.17,
+                                    eta_in=p.prices_storage_bussar.EfficiencyCharge,
+                                    eta_out=p.prices_storage_bussar.EfficiencyDischarge,
+                                    add_curtailment=True,
+                                    )
+        self.BE_list = objectives.BE/8
         self.LCOE_list = np.empty_like(KSPc_iter)
-        for i, KSPc in enumerate(tqdm(KSPc_iter)):
-            self.set_storage_constraints(
-                                        KSPc=KSPc,
-                                        KSPd=0.17,
-                                        eta_in=p.prices_storage_bussar.EfficiencyCharge,
-                                        eta_out=p.prices_storage_bussar.EfficiencyDischarge,
-                                        add_curtailment=True,
-                                        )
-            self.calculate_storage()
-            self.get_objectives()
-            self.calculate_LCOE()
-
-            self.BE_list[i] = np.sum(self.Bs1)/8
-            self.LCOE_list[i] = np.sum(self.LCOE1)
+        for i in range(len(KSPc_iter)):
+            self.LCOE_list[i] = np.sum(t.calculate_costs(self.beta_b, objectives.BE[i],
+                                                         objectives.K_SPc[i], objectives.K_SPd[i],
+                                                         objectives.K_SE[i], self.L_DE,
+                                                         p.prices_backup_leon, p.prices_storage_bussar))
 
         fig1, (ax1) = plt.subplots(1, 1, figsize=s.figure_size)
         ax1.plot(KSPc_iter, self.BE_list, label='$E^B/y$')
@@ -2,6 +2,8 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import sys
+import settings.tools as t
+from scipy.special import gammaln
 
 def get_backup(country, data_touple, path_to_data='results/'):
     """
@@ -30,7 +32,44 @@ def quantile(quantile, dataset):
     """
     Docstring for quantile.
     """
-    return np.sort(dataset)[int(round(quantile*len(dataset)))]
+    return t.quantile(quantile, dataset)
+
+def decluster(extreme_hours, ignore_hours):
+    """
+    Finds the extreme events that are kept when events closer than ignore_hours to the previous
+    kept event are ignored.
+
+    Parameters
+    ----------
+    extreme_hours:
+    The sorted hours of the extreme events.
+
+    ignore_hours:
+    The number of hours we want to ignore after each kept event.
+
+    Return
+    ------
+    kept:
+    The indices of the kept events in extreme_hours.
+    The first event is always kept and each following kept event is the first one more than
+    ignore_hours after the previous kept event. Instead of walking all the events, the next
+    kept event after every event is looked up at once and the chain from the first event is
+    followed by repeatedly doubling the jumps.
+    """
+    n = len(extreme_hours)
+    if n == 0:
+        return np.arange(0)
+    # The next kept event if event i is kept - n if there is none.
+    jump = np.searchsorted(extreme_hours, np.asarray(extreme_hours) + ignore_hours, side='right')
+    jump = np.append(jump, n)
+    kept = np.array([0])
+    while True:
+        following = jump[kept]
+        following = following[following < n]
+        if len(following) == 0:
+            return kept
+        kept = np.union1d(kept, following)
+        jump = jump[jump]
 
 def time_between_extreme_events(timeseries, q=0.99, ignore_hours=0):
     """
@@ -39,11 +78,13 @@ def time_between_extreme_events(timeseries, q=0.99, ignore_hours=0):
     Parameters
     ----------
     timeseries:
-    The timeseries we want to analyze.
+    The timeseries we want to analyze. Can also be an array with one
+    timeseries per row, e.g. the backup of all 30 countries.
 
     q:
     The quantile with which we want to quantify the extreme events.
     I.e. only event rarer than q are used in the analysis.
+    Can also be a list of quantiles.
 
     ignore_hours:
     The number of hours we want to ignore, if the waiting time
@@ -54,33 +95,30 @@ def time_between_extreme_events(timeseries, q=0.99, ignore_hours=0):
     np.diff(extreme_events):
     The difference between extreme events that are farther
     apart than ignore_hours.
+    With several timeseries or quantiles a list with a list of
+    waiting times for each timeseries is returned for each quantile.
     """
-    q = quantile(q, timeseries)
-    # find the hours that contain extreme events
-    extreme_events = np.arange(len(timeseries))[timeseries > q]
-    if ignore_hours == 0:
-        return np.diff(extreme_events)
-    elif ignore_hours > 0:
-        extreme_events_ignore = np.zeros(len(extreme_events), dtype=bool)
-        extreme_events_ignore[0] = True # We always want to include the first extreme event
-        # counter used to see when we exceed the number of ignored hours
-        counter = 0
-        for index, dif in enumerate(np.diff(extreme_events)):
-            counter += dif
-            if counter > ignore_hours:
-                # index + 1 works because index ranges from
-                # 0 to length(extreme_events) - 1
-                extreme_events_ignore[index + 1] = True
-                # reset the counter
-                counter = 0
-        # return the waiting times between the hours that contain extreme
-        # events and that are also more than ignore_hours apart.
-        return np.diff(extreme_events[extreme_events_ignore])
-    elif ignore_hours < 0:
+    if ignore_hours < 0:
         print('ignore_hours must be positive. Try again.')
-
-
-
+        return
+    data = np.atleast_2d(timeseries)
+    q_list = np.atleast_1d(q)
+    # All the quantiles for all the timeseries at once.
+    thresholds = t.quantiles(q_list, data).reshape(len(q_list), len(data))
+    waiting_times = []
+    for thresholds_q in thresholds:
+        waiting_times_q = []
+        for series, threshold in zip(data, thresholds_q):
+            # find the hours that contain extreme events
+            extreme_events = np.nonzero(series > threshold)[0]
+            if ignore_hours > 0:
+                # only the extreme events that are more than ignore_hours apart.
+                extreme_events = extreme_events[decluster(extreme_events, ignore_hours)]
+            waiting_times_q.append(np.diff(extreme_events))
+        waiting_times.append(waiting_times_q)
+    if np.ndim(timeseries) == 1 and np.ndim(q) == 0:
+        return waiting_times[0][0]
+    return waiting_times
 
 
     
@@ -98,19 +136,18 @@ if __name__ == '__main__':
     
 
     from scipy.optimize import curve_fit
-    from scipy.misc import factorial
     
     def poisson(k, lamb):
-        return (lamb**k/factorial(k))*np.exp(-lamb)
+        return np.exp(k*np.log(lamb) - gammaln(k + 1) - lamb)
 
     def log_factorial(n):
-        n = int(n)
-        return np.sum(np.log(np.arange(n) + 1))
+        # log(n!) for the integer part of n - works on arrays.
+        return gammaln(np.floor(n) + 1)
         
     def log_poisson(x, a, b):
         return a*x + b
 
-    ydata = np.log(hist) + np.asarray([log_factorial(n) for n in bins])
+    ydata = np.log(hist) + log_factorial(bins)
     xdata = bins[~np.isnan(ydata)]
     ydata = ydata[~np.isnan(ydata)]
     xdata = xdata[~np.isinf(ydata)]
@@ -2,6 +2,11 @@ import numpy as np
 import matplotlib.pyplot as plt
 import settings.settings as s
 import settings.tools as t
+import settings.store as st
+import settings.cache as ca
+import settings.iset as iset
+import settings.no_solve as ns
+import solve_networks.capacities as cap
 from tqdm import tqdm
 from mpl_toolkits.axes_grid1.inset_locator import zoomed_inset_axes, inset_axes, mark_inset
 
@@ -13,58 +18,30 @@ plt.style.use('seaborn-whitegrid')
 class FigurePlot():
 
     def __init__(self):
-        # SET DATA
-        self.EU = [np.load(s.iset_folder + s.iset_prefix + s.files[country]) for country in range(30)]
-        self.nhours = len(self.EU[18]['L'])
+        # SET DATA - the wind and solar data are read when they are needed.
         # LOADS
-        self.L_EU = np.array([n['L'] for n in self.EU])
+        self.L_EU = iset.get_all('L')
+        self.nhours = self.L_EU.shape[1]
         self.avg_L_EU = np.mean(np.sum(self.L_EU, axis=0))
         self.avg_L_DE = np.mean(self.L_EU[s.country_dict['DE']])
 
     def set_data_no_solve(self, alpha, gamma):
-        Gw_EU = np.empty((30, self.nhours))
-        Gs_EU = np.empty((30, self.nhours))
-
-        for n in range(30):
-            L = self.L_EU[n]
-            avg_L_n = np.mean(L)
-
-            Gw_n_norm = self.EU[n]['Gw']
-            Gs_n_norm = self.EU[n]['Gs']
-
-            avg_Gw_n = alpha * gamma * avg_L_n
-            avg_Gs_n = (1 - alpha) * gamma * avg_L_n
-
-            Gw_n = avg_Gw_n * Gw_n_norm
-            Gw_EU[n, :] = Gw_n
-
-            Gs_n = avg_Gs_n * Gs_n_norm
-            Gs_EU[n, :] = Gs_n
+        # Wind and solar generation scaled to the mean load of each country.
+        (L_EU, W_EU, S_EU) = ns.generation()
+        Gw_EU = alpha * gamma * W_EU
+        Gs_EU = (1 - alpha) * gamma * S_EU
 
         # Mismatch for each node in each timestep
-        D_n = np.array([Gw_EU[n] + Gs_EU[n] - self.L_EU[n] for n in range(30)])
-
-        # Curtailment in each node
-        C_n = np.copy(D_n)
-        C_n[C_n < 0] = 0
+        D_n = ns.mismatch(alpha, gamma)[0]
 
-        # Backup generation in each node in each timestep
-        G_B_n = np.copy(D_n)
-        G_B_n[G_B_n > 0] = 0
-        G_B_n *= -1
+        # Curtailment and backup generation in each node
+        C_n = np.maximum(D_n, 0)
+        G_B_n = np.maximum(-D_n, 0)
 
-        # Mismatch for whole EU
-        # D_EU = np.sum([Gw_EU[n] + Gs_EU[n]- L_EU[n] for n in range(30)], axis=0)
+        # Mismatch, curtailment and backup generation for whole EU
         D_EU = np.sum(D_n, axis=0)
-
-        # Curtailment for whole EU
-        C_EU = np.copy(D_EU)
-        C_EU[C_EU < 0] = 0
-
-        # Backup generation for whole EU
-        G_B_EU = np.copy(D_EU)
-        G_B_EU[G_B_EU > 0] = 0
-        G_B_EU *= -1
+        C_EU = np.maximum(D_EU, 0)
+        G_B_EU = np.maximum(-D_EU, 0)
 
         self.G_B_EU = G_B_EU
         return(Gw_EU, Gs_EU, D_n, C_n, G_B_n, D_EU, C_EU, G_B_EU)
@@ -76,8 +53,8 @@ class FigurePlot():
         '''
 
         # Loading data
-        N_b0 = np.load(s.nodes_fullname.format(c='c', f='s', a=0.80, b=0.00, g=1.00))
-        N_binf = np.load(s.nodes_fullname_inf.format(c='c', f='s', a=0.80, b=np.inf, g=1.00))
+        N_b0 = ca.load(s.nodes_fullname.format(c='c', f='s', a=0.80, b=0.00, g=1.00))
+        N_binf = ca.load(s.nodes_fullname_inf.format(c='c', f='s', a=0.80, b=np.inf, g=1.00))
 
         G_B_DE_b0 = N_b0.f.balancing[s.country_dict['DE']]
         G_B_DE_binf = N_binf.f.balancing[s.country_dict['DE']]
@@ -176,15 +153,12 @@ class FigurePlot():
         F22 is the backup capacity with different quantiles as a function of alpha.
         '''
         # Data for subplot 1
-        data_EU = np.empty(resolution)
-        data_DE = np.empty(resolution)
         alpha_list = np.linspace(0, 1, resolution)
 
-        for i, alpha in enumerate(alpha_list):
-            Gw_EU, Gs_EU, D_n, C_n, G_B_n, D_EU, C_EU, G_B_EU = self.set_data_no_solve(alpha, 1.0)
-            country = 'DE'
-            data_DE[i] = np.mean(G_B_n[s.country_dict[country]]) / self.avg_L_DE
-            data_EU[i] = np.mean(G_B_EU) / self.avg_L_EU
+        # All the alphas at once without solving.
+        stats = ns.grid_statistics(alpha_list, [1.0])
+        data_DE = stats.backup_mean[:, 0, s.country_dict['DE']] / self.avg_L_DE
+        data_EU = stats.backup_mean_EU[:, 0] / self.avg_L_EU
 
         # Data for subplot 2
         n = 51
@@ -198,20 +172,17 @@ class FigurePlot():
         K_B_n_binf_q99 = np.empty(n)
         K_B_n_binf_q999 = np.empty(n)
 
+        store = st.ScenarioStore()
         for i, alpha in tqdm(enumerate(alphas)):
             for beta in (0.00, np.inf):
+                balancing_DE = st.read_nodes('balancing', c='c', f='s', a=alpha, g=1.00, b=beta,
+                                             country='DE', store=store)
                 if beta == 0.00:
-                    N = np.load(s.nodes_fullname.format(c='c', f='s', a=alpha, b=beta, g=1.00))
-                    balancing_DE = N.f.balancing[s.country_dict['DE']]
-                    K_B_n_b0_q9[i] = t.quantile(0.9, balancing_DE)
-                    K_B_n_b0_q99[i] = t.quantile(0.99, balancing_DE)
-                    K_B_n_b0_q999[i] = t.quantile(0.999, balancing_DE)
+                    (K_B_n_b0_q9[i], K_B_n_b0_q99[i], K_B_n_b0_q999[i]) = t.quantiles(
+                            (0.9, 0.99, 0.999), balancing_DE)
                 else:
-                    N = np.load(s.nodes_fullname_inf.format(c='c', f='s', a=alpha, b=beta, g=1.00))
-                    balancing_DE = N.f.balancing[s.country_dict['DE']]
-                    K_B_n_binf_q9[i] = t.quantile(0.9, balancing_DE)
-                    K_B_n_binf_q99[i] = t.quantile(0.99, balancing_DE)
-                    K_B_n_binf_q999[i] = t.quantile(0.999, balancing_DE)
+                    (K_B_n_binf_q9[i], K_B_n_binf_q99[i], K_B_n_binf_q999[i]) = t.quantiles(
+                            (0.9, 0.99, 0.999), balancing_DE)
 
         K_B_n_b0_q9 /= self.avg_L_DE * 1000
         K_B_n_b0_q99 /= self.avg_L_DE * 1000
@@ -259,8 +230,8 @@ class FigurePlot():
         backup capacity for both zero and synchronized transmission.
         F3b is the number of hours per year that the backup generation exceeds a given backup capacity.
         '''
-        N_b0 = np.load(s.nodes_fullname.format(c='c', f='s', a=0.80, b=0.00, g=1.00))
-        N_binf = np.load(s.nodes_fullname_inf.format(c='c', f='s', a=0.80, b=np.inf, g=1.00))
+        N_b0 = ca.load(s.nodes_fullname.format(c='c', f='s', a=0.80, b=0.00, g=1.00))
+        N_binf = ca.load(s.nodes_fullname_inf.format(c='c', f='s', a=0.80, b=np.inf, g=1.00))
 
         G_B_DE_b0 = N_b0.f.balancing[s.country_dict['DE']]
         G_B_DE_binf = N_binf.f.balancing[s.country_dict['DE']]
@@ -271,24 +242,13 @@ class FigurePlot():
         npoints = 151
         stop = 1.5
 
-        avg_b0 = np.empty(npoints)
-        avg_binf = np.empty(npoints)
-
-        numbers_per_year_b0 = np.empty(npoints)
-        numbers_per_year_binf = np.empty(npoints)
-
         x = np.linspace(0, stop, npoints)
 
-        for i, beta_B_n in enumerate(x):
-            K = beta_B_n
-            data_b0 = [G_B_n - K if G_B_n - K >= 0 else 0 for G_B_n in G_B_DE_b0]
-            data_binf = [G_B_n - K if G_B_n - K >= 0 else 0 for G_B_n in G_B_DE_binf]
+        # Mean of max(G - K, 0) and number of hours with G > K for all the backup capacities K.
+        ((avg_b0, avg_binf), (hours_b0, hours_binf)) = t.exceedance((G_B_DE_b0, G_B_DE_binf), x)
 
-            numbers_per_year_b0[i] = np.count_nonzero(data_b0) / 8
-            numbers_per_year_binf[i] = np.count_nonzero(data_binf) / 8
-
-            avg_b0[i] = np.mean(data_b0)
-            avg_binf[i] = np.mean(data_binf)
+        numbers_per_year_b0 = hours_b0 / 8
+        numbers_per_year_binf = hours_binf / 8
 
         fig1, (ax1) = plt.subplots(1, 1)
         ax1.plot(x, avg_b0, 'r', label=r'$\beta^T=0$')
@@ -326,8 +286,8 @@ class FigurePlot():
         F45_rnd is the same a with randomized timeseries.
         '''
         # Loading the nodes-objects from the solved networks.
-        N_b0 = np.load(s.nodes_fullname.format(c='c', f='s', a=0.80, b=0.00, g=1.00))
-        N_binf = np.load(s.nodes_fullname_inf.format(c='c', f='s', a=0.80, b=np.inf, g=1.00))
+        N_b0 = ca.load(s.nodes_fullname.format(c='c', f='s', a=0.80, b=0.00, g=1.00))
+        N_binf = ca.load(s.nodes_fullname_inf.format(c='c', f='s', a=0.80, b=np.inf, g=1.00))
 
         # Extracting the backup generation of DE.
         G_B_DE_b0 = N_b0.f.balancing[s.country_dict['DE']]
@@ -354,45 +314,12 @@ class FigurePlot():
             data_b0_rnd = load_data_b0_rnd.f.arr_0
             data_binf_rnd = load_data_binf_rnd.f.arr_0
         else:
-            data_b0 = np.empty((len(K_range), len(t_range)))
-            data_binf = np.empty_like(data_b0)
-            data_b0_rnd = np.empty((len(K_range), len(t_range)))
-            data_binf_rnd = np.empty_like(data_b0)
-            for i, K in tqdm(enumerate(K_range)):
-                for j, dt in tqdm(enumerate(t_range)):
-
-                    # Setting all negative to 0.
-                    G_minus_K_b0 = [G - K if G - K >= 0 else 0 for G in G_B_DE_b0]
-                    G_minus_K_binf = [G - K if G - K >= 0 else 0 for G in G_B_DE_binf]
-
-                    # Randomizing
-                    G_minus_K_b0_rnd = np.copy(G_minus_K_b0)
-                    G_minus_K_binf_rnd = np.copy(G_minus_K_binf)
-                    np.random.shuffle(G_minus_K_b0_rnd)
-                    np.random.shuffle(G_minus_K_binf_rnd)
-
-                    # Getting indexes for nonzero-elements
-                    nonzero_b0 = np.nonzero(G_minus_K_b0)[0]
-                    nonzero_binf = np.nonzero(G_minus_K_binf)[0]
-                    nonzero_b0_rnd = np.nonzero(G_minus_K_b0_rnd)[0]
-                    nonzero_binf_rnd = np.nonzero(G_minus_K_binf_rnd)[0]
-
-                    # Number of qualified hours e.g. nonzero elements.
-                    N_qh_b0 = len(nonzero_b0)
-                    N_qh_binf = len(nonzero_binf)
-                    N_qh_b0_rnd = len(nonzero_b0_rnd)
-                    N_qh_binf_rnd = len(nonzero_binf_rnd)
-
-                    # Summing all the sums.
-                    data_b0[i, j] = np.sum([np.sum(G_minus_K_b0[t:t + dt])
-                                            for t in nonzero_b0]) / N_qh_b0
-                    data_binf[i, j] = np.sum([np.sum(G_minus_K_binf[t:t + dt])
-                                            for t in nonzero_binf]) / N_qh_binf
-
-                    data_b0_rnd[i, j] = np.sum([np.sum(G_minus_K_b0_rnd[t:t + dt])
-                                            for t in nonzero_b0_rnd]) / N_qh_b0_rnd
-                    data_binf_rnd[i, j] = np.sum([np.sum(G_minus_K_binf_rnd[t:t + dt])
-                                            for t in nonzero_binf_rnd]) / N_qh_binf_rnd
+            data_b0 = t.windowed_overshoot_energy(G_B_DE_b0, K_range, t_range)
+            data_binf = t.windowed_overshoot_energy(G_B_DE_binf, K_range, t_range)
+
+            # Randomized
+            data_b0_rnd = t.windowed_overshoot_energy(G_B_DE_b0, K_range, t_range, shuffle=True)
+            data_binf_rnd = t.windowed_overshoot_energy(G_B_DE_binf, K_range, t_range, shuffle=True)
 
             # Saving to files.
             np.savez_compressed(s.figures_folder + 'FIGURE4/' + 'data_b0.npz', data_b0)
@@ -645,7 +572,7 @@ class FigurePlot():
 
             K = beta_b
 
-            N_binf = np.load(s.nodes_fullname_inf.format(c='c', f='s', a=0.80, b=np.inf, g=1.00))
+            N_binf = ca.load(s.nodes_fullname_inf.format(c='c', f='s', a=0.80, b=np.inf, g=1.00))
 
             # Extracting the backup generation of DE.
             G_B_DE_binf = N_binf.f.balancing[s.country_dict['DE']]
@@ -702,8 +629,10 @@ class FigurePlot():
             
 
             # Figure 5c here
-            data_S = np.sort(t.find_minima(a_binf[1])* - 1)
-            data_S_rnd = np.sort(t.find_minima(a_binf_rnd[1]) * - 1)
+            # Storage depth of every event in both time series at once.
+            events = t.find_events((a_binf[1], a_binf_rnd[1]))
+            data_S = np.sort(events.depth[events.series == 0] * - 1)
+            data_S_rnd = np.sort(events.depth[events.series == 1] * - 1)
 
             fig, (ax) = plt.subplots(1, 1, sharex=True)
 
@@ -752,8 +681,8 @@ class FigurePlot():
                 data_binf_loss= np.empty_like(data_b0)
 
                 # Loading the nodes-object.
-                N_b0 = np.load(s.nodes_fullname.format(c='c', f='s', a=0.80, b=0.00, g=1.00))
-                N_binf = np.load(s.nodes_fullname_inf.format(c='c', f='s', a=0.80, b=np.inf, g=1.00))
+                N_b0 = ca.load(s.nodes_fullname.format(c='c', f='s', a=0.80, b=0.00, g=1.00))
+                N_binf = ca.load(s.nodes_fullname_inf.format(c='c', f='s', a=0.80, b=np.inf, g=1.00))
 
                 # Extracting the backup generation of DE.
                 G_B_DE_b0 = N_b0.f.balancing[s.country_dict['DE']]
@@ -819,8 +748,8 @@ class FigurePlot():
                 for i, gamma in tqdm(enumerate(gamma_list)):
 
                     # Loading the nodes-object.
-                    N_b0 = np.load(s.nodes_fullname.format(c='c', f='s', a=0.80, b=0.00, g=gamma))
-                    N_binf = np.load(s.nodes_fullname_inf.format(c='c', f='s', a=0.80, b=np.inf, g=gamma))
+                    N_b0 = ca.load(s.nodes_fullname.format(c='c', f='s', a=0.80, b=0.00, g=gamma))
+                    N_binf = ca.load(s.nodes_fullname_inf.format(c='c', f='s', a=0.80, b=np.inf, g=gamma))
 
                     # Extracting the backup generation of DE.
                     G_B_DE_b0 = N_b0.f.balancing[s.country_dict['DE']]
@@ -880,13 +809,9 @@ class FigurePlot():
 
         for i, alpha in tqdm(enumerate(alpha_list)):
 
-            # F_copper = np.load(copper_name.format(a=alpha))
-            F_copper = np.load(s.links_fullname.format(c='c', f='s', a=alpha, g=1.00, b=np.inf))
-            F_copper = F_copper.f.arr_0
-
-            F_abs = np.abs(F_copper)
-
-            K_T_l = np.array([t.quantile_old(0.99, link) for link in F_abs])
+            # Read from the h0 table of the copperflow, which is made from the stored basis flows
+            # the first time.
+            K_T_l = cap.get_caps(alpha, 1.00, quant=0.99)
 
             result1[i] = np.sum(K_T_l * distances)
             result2[i] = np.sum(K_T_l)
@@ -933,20 +858,18 @@ class FigurePlot():
         data2 = np.empty((len(beta_T_list), len(beta_T_list)))
         data3 = np.empty_like(beta_T_list)
 
+        store = st.ScenarioStore()
         for i, beta_T in tqdm(enumerate(beta_T_list)):
 #             N = t.load_remote_network('c_s_a0.80_g1.00_b{:.2f}'.format(beta_T), N_or_F='N')
-            N = np.load(s.nodes_fullname.format(c='c', f='s', a=alpha, b=beta_T, g=gamma))
-
             # Extracting the backup generation of DE.
-            G_B_DE = N.f.balancing[s.country_dict['DE']]
+            G_B_DE = st.read_nodes('balancing', c='c', f='s', a=alpha, g=gamma, b=beta_T,
+                                   country='DE', store=store)
 
             # Dividing by the average load to get relative units and converting to GW.
             G_B_DE /= (self.avg_L_DE * 1000)
 
             data1[i] = np.mean(G_B_DE)
-            data2[0, i] = t.quantile_old(0.9, G_B_DE)
-            data2[1, i] = t.quantile_old(0.99, G_B_DE)
-            data2[2, i] = t.quantile_old(0.999, G_B_DE)
+            data2[:3, i] = t.quantiles((0.9, 0.99, 0.999), G_B_DE, method='histogram')
             data3[i] = t.storage_size_relative(G_B_DE, 0.7)[0]
 
         fig1, (ax1) = plt.subplots(1, 1)
@@ -985,7 +908,7 @@ class FigurePlot():
             K_S_99 = np.empty_like(gamma_list)
 
             for i, g in enumerate(gamma_list):
-                N_binf = np.load(s.nodes_fullname_inf.format(c='c', f='s', a=0.80, b=np.inf, g=g))
+                N_binf = ca.load(s.nodes_fullname_inf.format(c='c', f='s', a=0.80, b=np.inf, g=g))
 
                 G_B_DE_binf = N_binf.f.balancing[s.country_dict['DE']]
 
@@ -1010,7 +933,7 @@ class FigurePlot():
             K_B_n_99 = np.empty_like(gamma_list)
 
             for i, g in enumerate(gamma_list):
-                    N_binf = np.load(s.nodes_fullname_inf.format(c='c', f='s', a=0.80, b=np.inf, g=g))
+                    N_binf = ca.load(s.nodes_fullname_inf.format(c='c', f='s', a=0.80, b=np.inf, g=g))
                     G_B_DE_binf = N_binf.f.balancing[s.country_dict['DE']]
                     G_B_DE_binf /= (self.avg_L_DE * 1000)
                     K_B_n_99[i] = t.quantile_old(0.99, G_B_DE_binf)
@@ -1039,13 +962,12 @@ class FigurePlot():
             data = np.empty_like(gamma_list)
 
             for i, g in enumerate(gamma_list):
-                N_binf = np.load(s.nodes_fullname_inf.format(c='c', f='s', a=0.80, b=np.inf, g=g))
+                N_binf = ca.load(s.nodes_fullname_inf.format(c='c', f='s', a=0.80, b=np.inf, g=g))
                 G_B_DE_binf = N_binf.f.balancing[s.country_dict['DE']]
                 G_B_DE_binf /= (self.avg_L_DE * 1000)
                 K = t.quantile_old(0.99, G_B_DE_binf)
-                G_K= [G_B_n - K if G_B_n - K >= 0 else 0 for G_B_n in G_B_DE_binf]
 
-                data[i] = np.mean(G_K)
+                data[i] = t.exceedance(G_B_DE_binf, K)[0]
 
             fig1, (ax1) = plt.subplots(1, 1)
             ax1.plot(gamma_list, data)
@@ -1058,7 +980,7 @@ class FigurePlot():
             data = np.empty_like(gamma_list)
 
             for i, g in enumerate(gamma_list):
-                N_binf = np.load(s.nodes_fullname_inf.format(c='c', f='s', a=0.80, b=np.inf, g=g))
+                N_binf = ca.load(s.nodes_fullname_inf.format(c='c', f='s', a=0.80, b=np.inf, g=g))
                 G_B_DE_binf = N_binf.f.balancing[s.country_dict['DE']]
                 G_B_DE_binf /= (self.avg_L_DE * 1000)
 
@@ -1076,7 +998,7 @@ class FigurePlot():
             gamma_list = np.linspace(0, 2, 11)
             data = np.empty_like(gamma_list)
             for i, g in enumerate(gamma_list):
-                N_binf = np.load(s.nodes_fullname_inf.format(c='c', f='s', a=0.80, b=np.inf, g=g))
+                N_binf = ca.load(s.nodes_fullname_inf.format(c='c', f='s', a=0.80, b=np.inf, g=g))
                 C_DE_binf = N_binf.f.curtailment[s.country_dict['DE']]
                 C_DE_binf /= (self.avg_L_DE * 1000)
                 data[i] = np.mean(C_DE_binf)
@@ -11,6 +11,7 @@ import colormaps as cmaps
 import matplotlib.pyplot as plt
 import regions.classes as cl
 import settings.tools as to
+import settings.iset as iset
 from itertools import product
 from solve_single_network import Data
 
@@ -40,9 +41,7 @@ class BackupEurope(object):
             os.mkdir(s.figures_folder)
 
         # Loading the loads from the ISET-data.
-        self.loads = np.array([np.load('%sISET_country_%s.npz'\
-                % (s.iset_folder, s.countries[node]))['L']\
-                for node in range(len(s.countries))])
+        self.loads = iset.get_all('L')
 
     def get_chosen_combinations(self, **kwargs):
         self.chosen_combinations = to.get_chosen_combinations(**kwargs)
@@ -81,21 +80,20 @@ class BackupEurope(object):
             quantile         [float]: the value of the quantile.
 
         '''
-        print combination_dict
+        print(combination_dict)
         # Check if path exists. Create it if not.
         if not os.path.exists(s.EBC_folder):
             os.mkdir(s.EBC_folder)
         if os.path.isfile(s.EBC_fullname.format(**combination_dict)):
             print('EC-file {0} already exists - skipping.'.format(combination_dict))
         else:
-#             combination_caps = np.zeros(len(s.countries))
             nodes = np.load(s.nodes_fullname.format(**combination_dict))
             balancing = nodes['balancing']
-#             for i, country_backup in enumerate(balancing):
-#                 combination_caps[i] = to.storage_size(country_backup, quantile)[0]
-            storage_size = to.storage_size(np.sum(balancing, axis=0), q=0.99)[0]
-            np.savez(s.EBC_fullname.format(**combination_dict), storage_size)
-#             np.savez(s.EBC_fullname.format(**combination_dict), combination_caps)
+            # Emergency storage for every country in one go with the backup capacity at the
+            # quantile.
+            capacities = to.quantiles(quantile, balancing)
+            combination_caps = to.storage_size(balancing, capacities)[0]
+            np.savez(s.EBC_fullname.format(**combination_dict), combination_caps)
             print('Saved EC-file: {0}'.format(combination_dict))
         return
 
@@ -246,16 +244,16 @@ class BackupEurope(object):
                      path=s.iset_folder,
                      prefix=s.iset_prefix)
 
-        storage_timeseries = np.zeros((30, N[0].nhours))
-        backup_offset = np.zeros((30, N[0].nhours))
-        balancing_timeseries_EU = np.zeros(N[0].nhours)
+        balancing = np.array([n.get_balancing() for n in N])
+        balancing_timeseries_EU = np.sum(balancing, axis=0)
 
+        # The storages of all the nodes are calculated together with the backup capacities at the
+        # 99 % quantile.
+        capacities = to.quantiles(0.99, balancing)
+        (storage_size, storage_timeseries, backup_offset) = to.storage_size(balancing, capacities)
 
-        for i, n in enumerate(N):
-            balancing_timeseries_EU += n.get_balancing()
-            (storage_size, storage_timeseries[i], backup_offset[i]) = to.storage_size(n.get_balancing(), q=0.99)
-
-        (storage_EU, storage_timeseries2, backup_offset2) = to.storage_size(balancing_timeseries_EU)
+        (storage_EU, storage_timeseries2, backup_offset2) = to.storage_size(balancing_timeseries_EU,
+                to.quantile(0.99, balancing_timeseries_EU))
 
         EUL_avg = np.mean(np.sum([x.load for x in N], axis=0))
         storage_timeseries = np.sum(storage_timeseries, axis=0) / EUL_avg
@@ -314,10 +312,7 @@ class BackupEurope(object):
         self._calculate_chosen_EC()
         a_list = []
         EC_list = []
-        EUL = np.array([np.load('%sISET_country_%s.npz'\
-                % (s.iset_folder, s.countries[node]))['L']\
-                for node in range(len(s.countries))])
-        EUL = np.sum(EUL, axis=0) * 1000
+        EUL = np.sum(iset.get_all('L'), axis=0) * 1000
         for combination in self.chosen_combinations:
             a_list.append(combination['a'])
             EC = np.load(s.EBC_fullname.format(**combination))
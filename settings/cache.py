@@ -0,0 +1,218 @@
+'''
+A cache of uncompressed arrays from the compressed .npz files of the solved networks.
+
+The first time a field (e.g. 'balancing') of a file is used, it is decompressed once and saved as
+an uncompressed .npy file in the cache folder. After that it is served through a memory map, so
+taking the row of a country is a view and only the pages that are used are read from disk. The
+arrays are mapped copy-on-write, so they can be changed in place without changing the cache.
+
+The cache is kept below a size by removing the least recently used arrays. Several processes can
+use the same cache: the index is only changed while holding a lock on it and the arrays are
+written atomically. When an array is used, only the time in memory is updated; the times are
+written to the index every 'flush_interval' seconds, when an array is added and at exit.
+
+Example
+-------
+N = load(s.nodes_fullname_inf.format(c='c', f='s', a=0.80, g=1.00, b=np.inf))
+G_B_DE = N.f.balancing[s.country_dict['DE']]
+'''
+import os
+import json
+import time
+import fcntl
+import atexit
+from contextlib import contextmanager
+import numpy as np
+import settings.settings as s
+
+
+class CachedFile():
+    '''
+    Stand-in for the object returned by np.load for a .npz file. The fields can be taken as
+    N['balancing'] or N.f.balancing and are only decompressed when they are used.
+    '''
+    def __init__(self, cache, filename):
+        self._cache = cache
+        self._filename = filename
+        with np.load(filename) as data:
+            self.files = list(data.files)
+        self.f = _FieldGetter(self)
+
+    def __getitem__(self, field):
+        if field not in self.files:
+            raise KeyError('{0} is not a file in {1}'.format(field, self._filename))
+        return(self._cache.get(self._filename, field))
+
+    def __contains__(self, field):
+        return(field in self.files)
+
+
+class _FieldGetter():
+    # Gives the fields as attributes like the .f of np.load.
+    def __init__(self, cached_file):
+        self._cached_file = cached_file
+
+    def __getattr__(self, field):
+        try:
+            return(self._cached_file[field])
+        except KeyError:
+            raise AttributeError(field)
+
+
+class ArrayCache():
+    '''
+    Class holding the uncompressed arrays in the cache folder and their index.
+
+    The index 'index.json' has for every cached array the file it came from, the modification time
+    of that file, the number of bytes and when it was last used. An array is made again if the file
+    it came from has changed.
+    '''
+    def __init__(self, path=s.cache_folder, max_bytes=s.cache_max_bytes, flush_interval=60):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.index_name = os.path.join(path, 'index.json')
+        self.index = {}
+        self._read_index()
+        # Times the arrays were used that are not written to the index yet.
+        self._used = {}
+        self._flushed = time.time()
+
+    @property
+    def nbytes(self):
+        return(sum(entry['bytes'] for entry in self.index.values()))
+
+    @contextmanager
+    def _lock(self):
+        # Exclusive lock on the index across processes.
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        with open(self.index_name + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_index(self):
+        # The index as other processes may have left it.
+        if os.path.isfile(self.index_name):
+            with open(self.index_name) as f:
+                self.index = json.load(f)
+        else:
+            self.index = {}
+
+    def _save_index(self):
+        # Only called with the lock held, after the index is read again.
+        for cache_name, last_used in self._used.items():
+            if cache_name in self.index:
+                self.index[cache_name]['last_used'] = max(last_used,
+                                                          self.index[cache_name]['last_used'])
+        self._used = {}
+        self._flushed = time.time()
+        temp_name = '{0}.{1}.tmp'.format(self.index_name, os.getpid())
+        with open(temp_name, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(temp_name, self.index_name)
+
+    def flush(self):
+        # Writes the times the arrays were used to the index.
+        if self._used:
+            with self._lock():
+                self._read_index()
+                self._save_index()
+
+    def _cache_name(self, filename, field):
+        name = os.path.splitext(os.path.basename(filename))[0]
+        return('{0}_{1}.npy'.format(name, field))
+
+    def _is_cached(self, cache_name, source, mtime):
+        entry = self.index.get(cache_name)
+        return(entry is not None and entry['source'] == source and entry['mtime'] == mtime
+               and os.path.isfile(os.path.join(self.path, cache_name)))
+
+    def get(self, filename, field):
+        '''
+        Returns a field of a .npz file as a copy-on-write memory map, making the uncompressed
+        array first if it is not in the cache.
+        '''
+        cache_name = self._cache_name(filename, field)
+        cache_fullname = os.path.join(self.path, cache_name)
+        source = os.path.abspath(filename)
+        mtime = os.path.getmtime(filename)
+        if self._is_cached(cache_name, source, mtime):
+            self._used[cache_name] = time.time()
+            if time.time() - self._flushed > self.flush_interval:
+                self.flush()
+            try:
+                return(np.load(cache_fullname, mmap_mode='c'))
+            except FileNotFoundError:
+                # Removed by another process in the meantime - it is made again.
+                pass
+        with self._lock():
+            self._read_index()
+            # Another process may have made it while we waited for the lock.
+            if not self._is_cached(cache_name, source, mtime):
+                with np.load(filename) as data:
+                    array = data[field]
+                # Written to a temporary file first so no process maps a half written array.
+                temp_name = '{0}.{1}.tmp.npy'.format(cache_fullname, os.getpid())
+                np.save(temp_name, array)
+                os.replace(temp_name, cache_fullname)
+                self.index[cache_name] = {'source': source, 'mtime': mtime,
+                                          'bytes': os.path.getsize(cache_fullname),
+                                          'last_used': time.time()}
+            self._used[cache_name] = time.time()
+            self._evict(keep=cache_name)
+            self._save_index()
+            return(np.load(cache_fullname, mmap_mode='c'))
+
+    def _evict(self, keep=None):
+        # Only called with the lock held.
+        by_last_use = sorted(self.index, key=lambda name: max(self.index[name]['last_used'],
+                                                              self._used.get(name, 0)))
+        total = self.nbytes
+        for cache_name in by_last_use:
+            if total <= self.max_bytes:
+                break
+            if cache_name == keep:
+                continue
+            total -= self.index[cache_name]['bytes']
+            cache_fullname = os.path.join(self.path, cache_name)
+            if os.path.isfile(cache_fullname):
+                os.remove(cache_fullname)
+            del self.index[cache_name]
+
+    def evict(self, keep=None):
+        '''
+        Removes the least recently used arrays until the cache is below max_bytes. The array named
+        'keep' is never removed.
+        '''
+        with self._lock():
+            self._read_index()
+            self._evict(keep)
+            self._save_index()
+
+    def clear(self):
+        # Removes all the arrays in the cache.
+        max_bytes = self.max_bytes
+        self.max_bytes = -1
+        self.evict()
+        self.max_bytes = max_bytes
+
+    def load(self, filename):
+        return(CachedFile(self, filename))
+
+
+_cache = None
+
+def load(filename):
+    '''
+    Use instead of np.load for the .npz files of solved networks. Uses the cache in
+    settings.cache_folder.
+    '''
+    global _cache
+    if _cache is None:
+        _cache = ArrayCache()
+        atexit.register(_cache.flush)
+    return(_cache.load(filename))
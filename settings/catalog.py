@@ -0,0 +1,157 @@
+'''
+Catalog of the solved networks in the nodes folder.
+
+The parameters of every file in results/N/ are kept in an SQLite database, so the solved networks
+with some parameters can be found without listing the folder and parsing all the file names.
+A network is added to the catalog when it is saved, so queries never list the folder. The catalog
+is built from the folder when it is first made; after files are copied, moved or deleted by hand
+it is rebuilt with update() - only new or changed files are read.
+
+The catalog also records the solver that made each network, which is not in the file name:
+'DC' or 'aurespf' for the aurespf solvers, 'qp' for 'qp.py' and 'superposition' for the square
+copperflow networks put together in 'superposition.py'. It is None for files found by update().
+
+Example
+-------
+with Catalog() as catalog:
+    catalog.select(c='c', g=1.00, a=slice(0.5, 0.9), b=[0.00, np.inf])
+    catalog.select(c='c', b=0.50, solver='qp')
+'''
+import os
+import sqlite3
+import numpy as np
+import settings.settings as s
+import settings.store as st
+
+
+parameters = ('c', 'f', 'a', 'g', 'b')
+solvers = ('DC', 'aurespf', 'qp', 'superposition')
+
+
+class Catalog():
+    '''
+    Class holding the SQLite catalog of solved networks.
+    '''
+    def __init__(self, path=s.catalog_fullname, nodes_folder=s.nodes_folder):
+        self.path = path
+        self.nodes_folder = nodes_folder
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        new = not os.path.isfile(path)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS scenarios ('
+                                'filename TEXT PRIMARY KEY, mtime REAL, '
+                                'c TEXT, f TEXT, a REAL, g REAL, b REAL, solver TEXT)')
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(scenarios)')]
+        if 'solver' not in columns:
+            # Catalogs made before the solver was recorded.
+            self.connection.execute('ALTER TABLE scenarios ADD COLUMN solver TEXT')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS parameters '
+                                'ON scenarios (c, f, a, g, b)')
+        self.connection.commit()
+        if new:
+            self.update()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return(self)
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, filename, solver=None):
+        '''
+        Adds a solved network and the solver that made it to the catalog. Returns False if the
+        name is not the name of a solved network.
+        '''
+        scenario = st.parse_result_name(filename)
+        if scenario is None or scenario[-1] != 'N':
+            return(False)
+        if solver is not None and solver not in solvers:
+            raise ValueError('Unknown solver {0}.'.format(solver))
+        self.connection.execute('INSERT OR REPLACE INTO scenarios VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                (os.path.basename(filename), os.path.getmtime(filename))
+                                + scenario[:-1] + (solver,))
+        self.connection.commit()
+        return(True)
+
+    def remove(self, filename):
+        # Takes a network out of the catalog, e.g. when its file is gone.
+        self.connection.execute('DELETE FROM scenarios WHERE filename = ?',
+                                (os.path.basename(filename),))
+        self.connection.commit()
+
+    def solver(self, filename):
+        # The solver of a network in the catalog, None if it is unknown.
+        row = self.connection.execute('SELECT solver FROM scenarios WHERE filename = ?',
+                                      (os.path.basename(filename),)).fetchone()
+        return(None if row is None else row[0])
+
+    def update(self):
+        '''
+        Rebuilds the catalog from the nodes folder, e.g. after files are copied into it or deleted
+        by hand. Only files that are new or changed since they were added are read and removed
+        files are taken out. Not needed for the networks saved by the solvers.
+        '''
+        if os.path.exists(self.nodes_folder):
+            names = os.listdir(self.nodes_folder)
+        else:
+            names = []
+        known = dict(self.connection.execute('SELECT filename, mtime FROM scenarios'))
+        for name in names:
+            fullname = os.path.join(self.nodes_folder, name)
+            if known.pop(name, None) != os.path.getmtime(fullname):
+                scenario = st.parse_result_name(name)
+                if scenario is not None and scenario[-1] == 'N':
+                    self.connection.execute('INSERT OR REPLACE INTO scenarios '
+                                            'VALUES (?, ?, ?, ?, ?, ?, ?, NULL)',
+                                            (name, os.path.getmtime(fullname)) + scenario[:-1])
+        # What is left was not found in the folder.
+        self.connection.executemany('DELETE FROM scenarios WHERE filename = ?',
+                                    [(name,) for name in known])
+        self.connection.commit()
+
+    def select(self, **kwargs):
+        '''
+        Finds the solved networks with the chosen parameters.
+
+        A parameter can be a value, a list of values or a slice with the range of values including
+        the ends, e.g. select(c='c', a=slice(0.5, 0.9), b=[0.00, np.inf]). The numbers are
+        compared with two decimals as in the file names. 'solver' chooses the networks made by
+        one of the solvers in 'solvers'.
+
+        returns:
+            list | dictionaries with the parameters, e.g. {'c':'c', 'f':'s', 'a':0.80, 'g':1.00,
+                   'b':0.50}, sorted by c, f, a, g and b.
+        '''
+        conditions = []
+        values = []
+        for (name, value) in kwargs.items():
+            if name not in parameters + ('solver',):
+                raise ValueError('Unknown parameter {0}.'.format(name))
+            if isinstance(value, slice):
+                if value.start is not None:
+                    conditions.append('{0} >= ?'.format(name))
+                    values.append(_rounded(name, value.start))
+                if value.stop is not None:
+                    conditions.append('{0} <= ?'.format(name))
+                    values.append(_rounded(name, value.stop))
+            else:
+                value_list = [_rounded(name, v) for v in np.atleast_1d(value)]
+                conditions.append('{0} IN ({1})'.format(name, ', '.join('?' * len(value_list))))
+                values.extend(value_list)
+        query = 'SELECT c, f, a, g, b FROM scenarios'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY c, f, a, g, b'
+        return([dict(zip(parameters, row)) for row in self.connection.execute(query, values)])
+
+
+def _rounded(name, value):
+    # The numbers in the file names have two decimals.
+    if name in ('c', 'f', 'solver'):
+        return(str(value))
+    return(round(float(value), 2))
@@ -0,0 +1,86 @@
+'''
+Shared loader for the ISET country data in the 'iset_folder' set in 'settings.py'.
+
+Every field ('L', 'Gw' or 'Gs') of a country is only read from its file the first time it is
+asked for, and then kept for the rest of the process. All the classes using the ISET data share
+the same arrays, so they are read-only.
+
+Example
+-------
+L_DE = get('DE', 'L')
+L_EU = get_all('L', threads=4)
+'''
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import settings.settings as s
+
+
+_arrays = {}
+_lock = threading.Lock()
+
+
+def _country_code(country):
+    # Country code from a code or a country number.
+    if isinstance(country, str):
+        return(country)
+    return(s.countries[country])
+
+
+def get(country, field='L'):
+    '''
+    Returns a field of a country from its ISET file.
+
+    parameters:
+        country: string or integer | country code or the number of the country in s.countries.
+        field:                string | 'L', 'Gw' or 'Gs'.
+    returns:
+        numpy array | read-only time series.
+    '''
+    key = (_country_code(country), field)
+    array = _arrays.get(key)
+    if array is None:
+        # Only the field asked for is decompressed.
+        with np.load(s.iset_folder + s.iset_prefix + key[0] + '.npz') as data:
+            array = data[field]
+        array.flags.writeable = False
+        with _lock:
+            array = _arrays.setdefault(key, array)
+    return(array)
+
+
+def get_all(field='L', countries=s.countries, threads=None):
+    '''
+    Returns a field for all the countries as one array with a row for each country.
+
+    parameters:
+        field:      string | 'L', 'Gw' or 'Gs'.
+        countries:    list | the countries in the order of the rows.
+        threads:   integer | number of files read at the same time. None reads one at a time.
+    returns:
+        numpy array | read-only array of shape (countries, hours).
+    '''
+    key = (tuple(_country_code(c) for c in countries), field)
+    array = _arrays.get(key)
+    if array is None:
+        if threads is None:
+            rows = [get(country, field) for country in key[0]]
+        else:
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                rows = list(pool.map(lambda country: get(country, field), key[0]))
+        array = np.array(rows)
+        array.flags.writeable = False
+        with _lock:
+            array = _arrays.setdefault(key, array)
+    return(array)
+
+
+def nhours():
+    # Number of hours in the ISET data.
+    return(len(get(s.countries[0], 'L')))
+
+
+def clear():
+    # Forgets all the arrays that have been read.
+    with _lock:
+        _arrays.clear()
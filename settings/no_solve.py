@@ -0,0 +1,141 @@
+'''
+Backup and curtailment without a network solve for a whole grid of alphas and gammas.
+
+Without transmission (beta = 0) every country covers its own mismatch
+    Delta_n = gamma * <L_n> * (alpha * Gw_n + (1 - alpha) * Gs_n) - L_n
+with backup max(-Delta_n, 0) and curtailment max(Delta_n, 0). With unlimited transmission
+(beta = inf, copper plate) the same holds for the summed European mismatch. Neither needs a solve,
+so the statistics for all the (alpha, gamma) points are found straight from the ISET data: the
+normalized wind and solar and the load are broadcast against the alphas and gammas, a chunk of grid
+points at a time so at most 's.no_solve_chunk_bytes' of mismatch is in memory.
+
+The values are in the units of the ISET data (GW) as in FigurePlot.
+
+Example
+-------
+stats = grid_statistics(np.linspace(0, 1, 101), [1.00], quantile_list=(0.99,))
+stats.backup_mean[:, 0, s.country_dict['DE']]
+'''
+from collections import namedtuple
+import numpy as np
+import settings.settings as s
+import settings.tools as t
+import settings.iset as iset
+
+
+GridStatistics = namedtuple('GridStatistics', ['alphas', 'gammas', 'quantile_list',
+                                               'backup_mean', 'curtailment_mean',
+                                               'backup_quantiles',
+                                               'backup_mean_EU', 'curtailment_mean_EU',
+                                               'backup_quantiles_EU'])
+
+
+def generation(countries=s.countries):
+    '''
+    The load and the normalized wind and solar time series scaled to the mean load of each
+    country, i.e. the generation with gamma = 1 and only wind or only solar.
+
+    returns:
+        (L, W, S) | arrays with shape (countries, hours).
+    '''
+    L = iset.get_all('L', countries=countries)
+    mean_load = np.mean(L, axis=1, keepdims=True)
+    W = mean_load * iset.get_all('Gw', countries=countries)
+    S = mean_load * iset.get_all('Gs', countries=countries)
+    return((L, W, S))
+
+
+def mismatch(alphas, gammas, countries=s.countries):
+    '''
+    The mismatch of every country for a list of (alpha, gamma) points.
+
+    parameters:
+        alphas: array | the alphas of the points.
+        gammas: array | the gammas of the points, same length as alphas.
+    returns:
+        array | shape (points, countries, hours).
+    '''
+    (L, W, S) = generation(countries)
+    return(_mismatch(np.atleast_1d(alphas), np.atleast_1d(gammas), L, W, S))
+
+
+def _mismatch(alphas, gammas, L, W, S):
+    # gamma * (alpha * W + (1 - alpha) * S) - L = gamma * S + alpha * gamma * (W - S) - L
+    D = gammas[:, None, None] * S
+    D += (alphas * gammas)[:, None, None] * (W - S)
+    D -= L
+    return(D)
+
+
+def iterate_grid(alphas, gammas, countries=s.countries, max_bytes=s.no_solve_chunk_bytes):
+    '''
+    Goes through all the (alpha, gamma) points of the grid a chunk at a time.
+
+    parameters:
+        max_bytes: integer | size of the mismatch of one chunk. At least one point is made.
+    returns:
+        generator of (points, D) | the flat indices of the points in the (alphas, gammas) grid and
+                                   their mismatch with shape (points, countries, hours).
+    '''
+    (L, W, S) = generation(countries)
+    (A, G) = np.meshgrid(np.atleast_1d(alphas), np.atleast_1d(gammas), indexing='ij')
+    (A, G) = (A.ravel(), G.ravel())
+    chunk = max(1, int(max_bytes // L.nbytes))
+    for start in range(0, len(A), chunk):
+        points = np.arange(start, min(start + chunk, len(A)))
+        yield (points, _mismatch(A[points], G[points], L, W, S))
+
+
+def grid_statistics(alphas, gammas, quantile_list=(), countries=s.countries,
+                    max_bytes=s.no_solve_chunk_bytes):
+    '''
+    Backup and curtailment statistics without transmission for every country and with unlimited
+    transmission for Europe, for all combinations of alphas and gammas.
+
+    parameters:
+        alphas:          array | the alphas of the grid.
+        gammas:          array | the gammas of the grid.
+        quantile_list:    list | quantiles of the backup to find, e.g. (0.9, 0.99, 0.999).
+        max_bytes:     integer | memory for the mismatch of a chunk of points. The quantiles use
+                                 about as much again.
+    returns:
+        GridStatistics | means with shape (alphas, gammas, countries) and (alphas, gammas) for
+                         Europe. The quantiles have the quantiles along the first axis.
+    '''
+    alphas = np.atleast_1d(np.asarray(alphas, dtype=float))
+    gammas = np.atleast_1d(np.asarray(gammas, dtype=float))
+    q = np.atleast_1d(np.asarray(quantile_list, dtype=float))
+    npoints = len(alphas) * len(gammas)
+    ncountries = len(countries)
+    backup_mean = np.empty((npoints, ncountries))
+    curtailment_mean = np.empty((npoints, ncountries))
+    backup_quantiles = np.empty((len(q), npoints, ncountries))
+    backup_mean_EU = np.empty(npoints)
+    curtailment_mean_EU = np.empty(npoints)
+    backup_quantiles_EU = np.empty((len(q), npoints))
+
+    for (points, D) in iterate_grid(alphas, gammas, countries, max_bytes):
+        D_EU = np.sum(D, axis=1)
+        # The mean of the curtailment and of the backup are the means of the positive and the
+        # negative part of the mismatch.
+        curtailment_mean[points] = np.mean(np.maximum(D, 0), axis=-1)
+        backup_mean[points] = curtailment_mean[points] - np.mean(D, axis=-1)
+        curtailment_mean_EU[points] = np.mean(np.maximum(D_EU, 0), axis=-1)
+        backup_mean_EU[points] = curtailment_mean_EU[points] - np.mean(D_EU, axis=-1)
+        if len(q):
+            # The backup quantiles are the mismatch quantiles of -D, as long as they are positive.
+            np.negative(D, out=D)
+            backup_quantiles[:, points] = np.maximum(t.quantiles(q, D), 0)
+            backup_quantiles_EU[:, points] = np.maximum(t.quantiles(q, -D_EU), 0)
+
+    shape = (len(alphas), len(gammas))
+    return(GridStatistics(alphas=alphas,
+                          gammas=gammas,
+                          quantile_list=q,
+                          backup_mean=backup_mean.reshape(shape + (ncountries,)),
+                          curtailment_mean=curtailment_mean.reshape(shape + (ncountries,)),
+                          backup_quantiles=backup_quantiles.reshape((len(q),) + shape
+                                                                    + (ncountries,)),
+                          backup_mean_EU=backup_mean_EU.reshape(shape),
+                          curtailment_mean_EU=curtailment_mean_EU.reshape(shape),
+                          backup_quantiles_EU=backup_quantiles_EU.reshape((len(q),) + shape)))
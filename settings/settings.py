@@ -53,11 +53,27 @@ nodes_fullname_inf = nodes_folder + nodes_name_inf + '_N.npz'
 
 
 links_folder    = results_folder + 'F/'
+shards_folder   = results_folder + 'shards/'
 links_fullname  = links_folder + nodes_name + '_F.npz'
 
 copper_folder   = results_folder + 'copperflows/'
 copper_name     = 'copperflow_a{0:.2f}_g{1:.2f}.npy'
 copper_fullname = copper_folder + copper_name
+copper_fullname_linear = copper_folder + 'copperflow_a{0:.2f}_g{1:.2f}_linear.npy'
+copper_basis_fullname  = copper_folder + 'copperflow_basis.npz'
+# Quantiles kept in the h0 table of every copperflow.
+h0_quantiles    = [0.90, 0.95, 0.99, 0.999]
+
+store_folder    = results_folder + 'store/'
+
+catalog_fullname = results_folder + 'catalog.sqlite'
+ledger_fullname  = results_folder + 'ledger.jsonl'
+
+cache_folder    = results_folder + 'cache/'
+cache_max_bytes = 20 * 1024**3
+
+# Memory used at a time when the mismatch is made for a grid of alphas and gammas.
+no_solve_chunk_bytes = 2 * 1024**3
 
 EBC_folder      = results_folder + 'emergency_capacities/'
 EBC_name        = 'EC_' + nodes_name
@@ -0,0 +1,137 @@
+'''
+Publishing of large arrays in shared memory for the workers of a process pool.
+
+The ISET data and the balancing of solved networks are (countries x hours) arrays that every worker
+needs. Instead of pickling them to each worker or letting every worker read the files, the main
+process copies them once into shared memory blocks. The workers only get a small descriptor with
+the name, shape and dtype of each block, and attach to it as a numpy array without copying.
+The blocks are removed when the main process exits. The parallel sweep in
+'solve_networks/solve_multiple_networks.py' publishes the ISET data this way for its jobs.
+
+Only code reading the ISET data through 'settings/iset.py' gets the shared arrays - in the sweep
+that is the basis of the square copperflows. The Nodes objects of regions.classes, which the
+DC-solver, aurespf and the qp solver in 'Data' work on, read the ISET files from disk themselves
+and take a path and file names, not arrays, so every job still reads those files once.
+
+Example
+-------
+descriptors = publish_iset()
+with ProcessPoolExecutor(initializer=init_worker, initargs=(descriptors,)) as pool:
+    ...
+# In the workers iset.get_all('L') and iset.get('DE', 'Gw') are now views of the shared memory.
+'''
+import atexit
+from collections import namedtuple
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+import settings.settings as s
+import settings.iset as iset
+import settings.store as st
+
+
+SharedArray = namedtuple('SharedArray', ['name', 'shape', 'dtype'])
+
+# Blocks made by this process and blocks attached to. Kept so the memory stays mapped.
+_published = {}
+_attached = {}
+
+
+def publish(array):
+    '''
+    Copies an array into a new shared memory block.
+
+    returns:
+        SharedArray | descriptor that can be sent to other processes and used with 'attach'.
+    '''
+    array = np.ascontiguousarray(array)
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+    shared[...] = array
+    descriptor = SharedArray(block.name, array.shape, array.dtype.str)
+    _published[block.name] = block
+    return(descriptor)
+
+
+def _open_untracked(name):
+    # Blocks that are only attached to must not be removed when this process exits - they belong to
+    # the process that published them. The workers of a pool share the resource tracker of the main
+    # process, where the block is registered already. Any other process has a tracker of its own,
+    # which would remove the block at exit, so only this block is taken out of that tracker again.
+    block = shared_memory.SharedMemory(name=name)
+    if multiprocessing.parent_process() is None:
+        resource_tracker.unregister(block._name, 'shared_memory')
+    return(block)
+
+
+def attach(descriptor):
+    '''
+    Returns the array in a shared memory block as a read-only numpy array without copying.
+    '''
+    block = _published.get(descriptor.name) or _attached.get(descriptor.name)
+    if block is None:
+        block = _open_untracked(descriptor.name)
+        _attached[descriptor.name] = block
+    array = np.ndarray(tuple(descriptor.shape), dtype=descriptor.dtype, buffer=block.buf)
+    array.flags.writeable = False
+    return(array)
+
+
+def publish_iset(fields=('L', 'Gw', 'Gs')):
+    '''
+    Publishes the ISET data of all the countries.
+
+    returns:
+        dictionary | {('iset', field): SharedArray} to hand to 'init_worker'.
+    '''
+    return({('iset', field): publish(iset.get_all(field)) for field in fields})
+
+
+def publish_nodes(c, f, a, g, b, fields=('balancing', 'curtailment')):
+    '''
+    Publishes fields of a solved network for all the countries.
+
+    returns:
+        dictionary | {(c, f, a, g, b, field): SharedArray} to hand to 'init_worker'.
+    '''
+    return({(c, f, a, g, b, field): publish(st.read_nodes(field, c, f, a, g, b))
+            for field in fields})
+
+
+def init_worker(descriptors):
+    '''
+    Initializer for the workers of a process pool. Attaches to all the published arrays and puts the
+    ISET data into the ISET loader, so iset.get and iset.get_all use the shared memory.
+    '''
+    for key, descriptor in descriptors.items():
+        array = attach(descriptor)
+        if key[0] == 'iset':
+            field = key[1]
+            iset._arrays[(tuple(s.countries), field)] = array
+            for country, row in zip(s.countries, array):
+                iset._arrays[(country, field)] = row
+
+
+def get_nodes(descriptors, field, c, f, a, g, b):
+    # The published field of a solved network in a worker.
+    return(attach(descriptors[(c, f, a, g, b, field)]))
+
+
+def release(descriptors=None):
+    '''
+    Removes published blocks - the ones in 'descriptors' or all of them. Workers still attached
+    keep their memory until they detach.
+    '''
+    names = list(_published) if descriptors is None else [d.name for d in descriptors.values()]
+    for name in names:
+        block = _published.pop(name, None)
+        if block is not None:
+            try:
+                block.close()
+            except BufferError:
+                # Arrays in this process still use the block - it is unmapped when they are gone.
+                pass
+            block.unlink()
+
+
+atexit.register(release)
@@ -0,0 +1,287 @@
+'''
+A consolidated store for the solved networks.
+
+Instead of one compressed .npz file per (c, f, a, g, b) every field (e.g. 'balancing') of all the
+scenarios is appended to one uncompressed binary file, and an index keeps track of where each
+scenario is in the file. A single country or a range of hours can then be read directly from the
+file through a memory map, without decompressing anything else.
+
+The modification time and size of every imported file are kept in the index. When a network has
+been solved again since it was imported, 'read_nodes' reads the new file instead of the store
+until the file is imported again.
+
+Several processes can add to the same store: the index is locked while the field files are
+appended to and the index is written, and it is read again under the lock first.
+
+Example
+-------
+store = ScenarioStore()
+store.import_folders()
+B_DE = store.read('balancing', c='c', f='s', a=0.80, g=1.00, b=np.inf, country='DE')
+'''
+import os
+import re
+import json
+import fcntl
+from contextlib import contextmanager
+import numpy as np
+import settings.settings as s
+import settings.cache as ca
+
+
+# Matches the names made from settings.nodes_name, e.g. 'c_s_a0.80_g1.00_binf_N.npz'.
+result_name_pattern = re.compile(r'^(?P<c>[cu])_(?P<f>[sl])_a(?P<a>[0-9.]+)_g(?P<g>[0-9.]+)'
+                                 r'_b(?P<b>[0-9.]+|inf)_(?P<kind>[NF])\.npz$')
+
+
+def _select(data, country, hours):
+    # The rows of a country code, a row number or a list of these and a slice or (start, stop) of
+    # hours.
+    if country is not None:
+        if isinstance(country, str):
+            country = s.country_dict[country]
+        elif not np.isscalar(country):
+            country = [s.country_dict[n] if isinstance(n, str) else n for n in country]
+        data = data[country]
+    if hours is not None:
+        if not isinstance(hours, slice):
+            hours = slice(*hours)
+        data = data[..., hours]
+    return(data)
+
+
+def scenario_key(c, f, a, g, b):
+    '''
+    The name of a scenario in the store. Same as settings.nodes_name, also for b = inf.
+    '''
+    if np.isinf(b):
+        return s.nodes_name_inf.format(c=c, f=f, a=a, g=g, b='inf')
+    return s.nodes_name.format(c=c, f=f, a=a, g=g, b=b)
+
+
+def parse_result_name(filename):
+    '''
+    Finds the scenario of a file in results/N/ or results/F/.
+
+    returns:
+        (c, f, a, g, b, kind) with kind being 'N' or 'F' - or None if the name doesn't match.
+    '''
+    match = result_name_pattern.match(os.path.basename(filename))
+    if match is None:
+        return None
+    return(match.group('c'), match.group('f'), float(match.group('a')), float(match.group('g')),
+           float(match.group('b')), match.group('kind'))
+
+
+class ScenarioStore():
+    '''
+    Class holding the time series of many solved networks in one indexed store.
+
+    Each field is kept in its own file '<field>.dat' in the store folder. The index in
+    'index.json' has the offset, shape and dtype of every field of every scenario, and the
+    modification time and size of the N and F files they were imported from. The flows from
+    results/F/ are stored in the field 'F'.
+    '''
+    def __init__(self, path=s.store_folder):
+        self.path = path
+        self.index_name = os.path.join(path, 'index.json')
+        self.index = {}
+        self.index_mtime = None
+        self.refresh()
+
+    def refresh(self):
+        # Reads the index again if it has been changed on disk, e.g. by another process.
+        mtime = os.path.getmtime(self.index_name) if os.path.isfile(self.index_name) else None
+        if mtime != self.index_mtime:
+            self._read_index()
+
+    @contextmanager
+    def _lock(self):
+        # Exclusive lock on the index and the field files across processes.
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        with open(self.index_name + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_index(self):
+        # The index as other processes may have left it.
+        if os.path.isfile(self.index_name):
+            self.index_mtime = os.path.getmtime(self.index_name)
+            with open(self.index_name) as f:
+                self.index = json.load(f)
+        else:
+            self.index = {}
+            self.index_mtime = None
+
+    def __contains__(self, key):
+        return(scenario_key(*key) in self.index)
+
+    def keys(self):
+        # All the scenarios in the store as (c, f, a, g, b).
+        return([(e['c'], e['f'], e['a'], e['g'], e['b']) for e in self.index.values()])
+
+    def fields(self, c, f, a, g, b):
+        return(sorted(self.index[scenario_key(c, f, a, g, b)]['fields']))
+
+    def _save_index(self):
+        # Only called with the lock held, after the index is read again. Written to a temporary
+        # file first so a crash never leaves a broken index.
+        temp_name = '{0}.{1}.tmp'.format(self.index_name, os.getpid())
+        with open(temp_name, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(temp_name, self.index_name)
+        self.index_mtime = os.path.getmtime(self.index_name)
+
+    def write(self, c, f, a, g, b, **arrays):
+        '''
+        Adds the arrays of one scenario to the store, e.g. write('c', 's', 0.8, 1.0, np.inf,
+        balancing=B). Only numerical arrays are stored. Writing a field again appends the new
+        array and points the index to it.
+        '''
+        with self._lock():
+            self._read_index()
+            self._append(c, f, a, g, b, arrays)
+            self._save_index()
+
+    def _append(self, c, f, a, g, b, arrays):
+        # Appends the arrays to the field files and points the index to them. Returns the entry.
+        # Only called with the lock held.
+        key = scenario_key(c, f, a, g, b)
+        entry = self.index.setdefault(key, {'c': c, 'f': f, 'a': round(float(a), 2),
+                                            'g': round(float(g), 2), 'b': float(b),
+                                            'fields': {}})
+        for field, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            if array.dtype.kind not in 'biuf':
+                continue
+            data_name = field + '.dat'
+            with open(os.path.join(self.path, data_name), 'ab') as data_file:
+                offset = data_file.tell()
+                data_file.write(array.tobytes())
+            entry['fields'][field] = {'file': data_name,
+                                      'offset': offset,
+                                      'shape': list(array.shape),
+                                      'dtype': array.dtype.str}
+        return(entry)
+
+    def is_current(self, c, f, a, g, b, kind='N'):
+        '''
+        Whether the store has the scenario as it is in its N (or F) file now. Scenarios that were
+        not imported from a file, or whose file is gone, are current.
+        '''
+        entry = self.index.get(scenario_key(c, f, a, g, b))
+        if entry is None:
+            return(False)
+        source = entry.get('sources', {}).get(kind)
+        if source is None or not os.path.isfile(source['file']):
+            return(True)
+        stat = os.stat(source['file'])
+        return(stat.st_mtime == source['mtime'] and stat.st_size == source['size'])
+
+    def read(self, field, c, f, a, g, b, country=None, hours=None):
+        '''
+        Reads a field of one scenario.
+
+        parameters:
+            field:                   string | e.g. 'balancing', 'curtailment' or 'F'.
+            c, f, a, g, b:                  | the scenario as in settings.nodes_name.
+            country:     string/int or list | country code or row number(s), e.g. the link number
+                                              for 'F'. None reads all rows.
+            hours:   slice or (start, stop) | the hours to read. None reads all hours.
+        returns:
+            numpy array | a copy of the requested part of the field.
+        '''
+        record = self.index[scenario_key(c, f, a, g, b)]['fields'][field]
+        shape = tuple(record['shape'])
+        if np.prod(shape) == 0:
+            data = np.empty(shape, dtype=record['dtype'])
+        else:
+            data = np.memmap(os.path.join(self.path, record['file']), dtype=record['dtype'],
+                             mode='r', offset=record['offset'], shape=shape)
+        data = _select(data, country, hours)
+        return(np.array(data))
+
+    def import_file(self, filename, overwrite=False):
+        '''
+        Adds a file from results/N/ or results/F/ to the store. Returns False if the file name is
+        not a result name or the scenario is already there from the same file. A file that has
+        changed since it was imported is imported again.
+        '''
+        scenario = parse_result_name(filename)
+        if scenario is None:
+            return(False)
+        c, f, a, g, b, kind = scenario
+        key = scenario_key(c, f, a, g, b)
+        with self._lock():
+            # Another process may have imported it while we waited for the lock.
+            self._read_index()
+            # The flows are in the field 'F' and the nodes are recognised by their balancing.
+            if key in self.index and not overwrite:
+                if (('F' if kind == 'F' else 'balancing') in self.index[key]['fields']
+                        and self.is_current(c, f, a, g, b, kind)):
+                    return(False)
+            stat = os.stat(filename)
+            with np.load(filename) as data:
+                if kind == 'F':
+                    arrays = {'F': data['arr_0']}
+                else:
+                    arrays = {}
+                    for field in data.files:
+                        try:
+                            arrays[field] = data[field]
+                        except ValueError:
+                            # Pickled objects are not stored.
+                            continue
+            entry = self._append(c, f, a, g, b, arrays)
+            entry.setdefault('sources', {})[kind] = {'file': os.path.abspath(filename),
+                                                     'mtime': stat.st_mtime,
+                                                     'size': stat.st_size}
+            self._save_index()
+        return(True)
+
+    def import_folders(self, nodes_folder=s.nodes_folder, links_folder=s.links_folder,
+                       overwrite=False):
+        '''
+        Adds all the solved networks in the N and F folders to the store.
+
+        returns:
+            list | the names of the files that were imported.
+        '''
+        imported = []
+        for folder in (nodes_folder, links_folder):
+            if not os.path.exists(folder):
+                continue
+            for name in sorted(os.listdir(folder)):
+                if self.import_file(os.path.join(folder, name), overwrite=overwrite):
+                    imported.append(name)
+        return(imported)
+
+
+# The store used by 'read_nodes' when none is given, kept between calls.
+_stores = {}
+
+
+def read_nodes(field, c, f, a, g, b, country=None, hours=None, store=None):
+    '''
+    Reads a field of a solved network from the store if it is there and up to date with its N
+    file, and otherwise from the file in results/N/ through the array cache. Takes the same
+    parameters as ScenarioStore.read.
+    '''
+    if store is None:
+        store = _stores.get(s.store_folder)
+        if store is None:
+            store = _stores.setdefault(s.store_folder, ScenarioStore())
+        else:
+            store.refresh()
+    if ((c, f, a, g, b) in store and field in store.fields(c, f, a, g, b)
+            and store.is_current(c, f, a, g, b)):
+        return(store.read(field, c, f, a, g, b, country=country, hours=hours))
+    if np.isinf(b):
+        filename = s.nodes_fullname_inf.format(c=c, f=f, a=a, g=g, b=b)
+    else:
+        filename = s.nodes_fullname.format(c=c, f=f, a=a, g=g, b=b)
+    return(_select(ca.load(filename)[field], country, hours))
@@ -1,6 +1,8 @@
 import os
 import subprocess
+from collections import namedtuple
 import settings.settings as s
+import settings.catalog as ct
 import numpy as np
 import matplotlib.pyplot as plt
 
@@ -14,16 +16,11 @@ def read_from_file():
     Returns a list of dictionaries with the values from the files in the form:
         [{'c':'u', 'f':'s', 'a':1.00, 'g':1.00, 'b':1.00},
             {'c':'c', 'f':'s', 'a':1.00, 'g':1.00, 'b':1.00}]
+    The values are taken from the catalog in 'settings/catalog.py'. Files put in the folder by
+    hand are only found after updating the catalog with 'update()'.
     '''
-    filename_list = os.listdir(s.nodes_folder)
-    all_combinations = []
-    for name in filename_list:
-        all_combinations.append({'c':name[0],
-                                 'f':name[2],
-                                 'a':float(name[5:9]),
-                                 'g':float(name[11:15]),
-                                 'b':float(name[17:21])})
-    return all_combinations
+    with ct.Catalog() as catalog:
+        return catalog.select()
 
 
 def get_chosen_combinations(**kwargs):
@@ -36,33 +33,17 @@ def get_chosen_combinations(**kwargs):
     All unconstrained networks with a gamma = 1.00 can be found by:
         self.get_chosen_combinations(c='u', g=1.00)
 
+    A value can also be a list of values or a slice with a range of values:
+        self.get_chosen_combinations(a=slice(0.50, 0.90), b=[0.00, np.inf])
+
     returns a list of dictionaries with the desired values.
     For instance:
         [{'c':'u', 'f':'s', 'a':1.00, 'g':1.00, 'b':1.00},
             {'c':'c', 'f':'s', 'a':0.80, 'g':1.00, 'b':0.50}
             ...]
     '''
-    def _check_in_dict(dic, kwargs):
-        """ Check if values are present in a dictionary.
-
-        Args:
-            dic: dictionary to check in.
-            kwargs: the keyword arguments to check for in the dictionary.
-        Returns:
-            boolean: True if all values are present in the dictionary, False if any are not.
-        """
-        for (name, value) in kwargs.items():
-            value = np.array(value)
-            if not dic[name] in value:
-                return False
-        return True
-
-    chosen_combinations = []
-    # Checking all combinations.
-    for combination in read_from_file():
-
-        if _check_in_dict(combination, kwargs):
-            chosen_combinations.append(combination)
+    with ct.Catalog() as catalog:
+        chosen_combinations = catalog.select(**kwargs)
 
     if len(chosen_combinations) == 0:
         # Raise error if no chosen combinations are found.
@@ -77,7 +58,7 @@ def quantile(quantile, dataset):
         quantile [float]: the desired quantile eg. 0.99.
         dataset [list/1-dimensional array]: a timeseries.
     """
-    return np.sort(dataset)[int(round(quantile*len(dataset)))]
+    return quantiles(quantile, dataset)
 
 
 def quantile_old(quantile, dataset, cutzeros=False):
@@ -85,20 +66,205 @@ def quantile_old(quantile, dataset, cutzeros=False):
     Takes a list of numbers, converts it to a list without zeros
     and returns the value of the 99% quantile.
     """
-    if cutzeros:
-        # Removing zeros
-        dataset = dataset[np.nonzero(dataset)]
-    # Convert to numpy histogram
-    hist, bin_edges = np.histogram(dataset, bins = 10000, normed = True)
-    dif = np.diff(bin_edges)[0]
-    q = 0
-    for index, val in enumerate(reversed(hist)):
-        q += val*dif
-        if q > 1 - float(quantile):
-            #print 'Found %.3f quantile' % (1 - q)
-            return bin_edges[-index]
+    return quantiles(quantile, dataset, method='histogram', cutzeros=cutzeros)
+
+
+def quantiles(quantile_list, dataset, axis=-1, method='sort', cutzeros=False):
+    """
+    Finds several quantiles of one or more time series at once.
+
+    With method='sort' the values are the same as from 'quantile' - the element with index
+    round(q * n) in the sorted time series. Only those elements are put in place with a partial
+    sort (np.partition) instead of sorting the whole time series.
+
+    With method='histogram' the values are the same as from the old histogram based quantile: the
+    left bin edge found when walking a normed 10,000-bin histogram from the top until more than
+    1 - q of the time series is passed. The histogram is made once per time series and walked for
+    all quantiles with a cumulative sum. NaN is returned where the old function returned None.
+
+    Args:
+        quantile_list [float/list]: the desired quantiles eg. (0.99, 0.999).
+        dataset [array]: a timeseries or an array of timeseries eg. with shape (links, hours).
+        axis [integer]: the time axis of the dataset.
+        method [string]: 'sort' or 'histogram'.
+        cutzeros [boolean]: whether to remove zeros before finding the quantiles. Only used with
+            method='histogram'.
+    Returns:
+        quantiles [float/array]: with the quantiles along the first axis followed by the
+            dataset's axes without the time axis. A single quantile gives no quantile axis.
+    """
+    data = np.moveaxis(np.asarray(dataset, dtype=float), axis, -1)
+    q = np.atleast_1d(np.asarray(quantile_list, dtype=float))
+    n = data.shape[-1]
+
+    if method == 'sort':
+        indices = [int(round(qi * n)) for qi in q]
+        result = np.partition(data, sorted(set(indices)), axis=-1)[..., indices]
+    elif method == 'histogram':
+        rows = data.reshape(int(np.prod(data.shape[:-1])), n)
+        result = np.empty((len(rows), len(q)))
+        for i, row in enumerate(rows):
+            if cutzeros:
+                # Removing zeros
+                row = row[np.nonzero(row)]
+            hist, bin_edges = np.histogram(row, bins=10000, density=True)
+            dif = np.diff(bin_edges)[0]
+            # Probability above each bin edge - walking the histogram from the top.
+            tail = np.cumsum(hist[::-1] * dif)
+            for j, qi in enumerate(q):
+                passed = tail > 1 - float(qi)
+                index = np.argmax(passed)
+                result[i, j] = bin_edges[-index] if passed[index] else np.nan
+        result = result.reshape(data.shape[:-1] + (len(q),))
+    else:
+        raise ValueError('Unknown quantile method {0}.'.format(method))
+
+    result = np.moveaxis(result, -1, 0)
+    if np.ndim(quantile_list) == 0:
+        return result[0]
+    return result
+
+
+def exceedance(timeseries, capacities, axis=-1):
+    """
+    Finds the mean overshoot <max(G - K, 0)> and the number of hours with G > K of time series G
+    for many capacities K.
+
+    Each time series is sorted once. The sum of all values above a capacity is then read from
+    cumulative sums of the sorted values, so each capacity only costs a binary search.
+
+    Args:
+        timeseries [array]: a timeseries or an array of timeseries eg. with shape
+            (scenarios, countries, hours).
+        capacities [float/array]: the capacities K to compare with.
+        axis [integer]: the time axis of the timeseries.
+    Returns:
+        mean_overshoot [array]: <max(G - K, 0)> with the timeseries' axes without the time axis
+            followed by the axes of the capacities.
+        hours_above [array]: the number of hours with G > K with the same shape.
+        A timeseries without hours has no mean overshoot (NaN) and no hours above.
+    """
+    data = np.moveaxis(np.asarray(timeseries, dtype=float), axis, -1)
+    K = np.asarray(capacities, dtype=float)
+    n = data.shape[-1]
+    rows = data.reshape(int(np.prod(data.shape[:-1])), n)
+
+    mean_overshoot = np.empty((len(rows),) + K.shape)
+    hours_above = np.empty((len(rows),) + K.shape, dtype=int)
+    for i, row in enumerate(rows):
+        row_sorted = np.sort(row)
+        # Sum of the values from each index to the end.
+        tail_sums = np.append(np.cumsum(row_sorted[::-1])[::-1], 0)
+        first_above = np.searchsorted(row_sorted, K, side='right')
+        hours_above[i] = n - first_above
+        with np.errstate(invalid='ignore'):
+            mean_overshoot[i] = (tail_sums[first_above] - K * hours_above[i]) / n
+
+    shape = data.shape[:-1] + K.shape
+    return(mean_overshoot.reshape(shape), hours_above.reshape(shape))
+
+
+def windowed_overshoot_energy(timeseries, capacities, windows, shuffle=False):
+    """
+    Finds the emergency backup energy E(dt): the energy of max(G - K, 0) in the dt hours starting
+    at each hour with G > K, averaged over those hours.
+
+    The sum over each window is the difference of two cumulative sums, so each window length is
+    one array lookup over all the qualified hours.
+
+    Args:
+        timeseries [array]: the backup generation timeseries G.
+        capacities [float/list]: the backup capacities K.
+        windows [list]: the window lengths dt in hours.
+        shuffle [boolean]: whether to use a randomly shuffled timeseries as a surrogate without
+            correlations in time.
+    Returns:
+        energy [array]: E(dt) with shape (len(capacities), len(windows)).
+    """
+    G = np.array(timeseries, dtype=float)
+    if shuffle:
+        G = np.random.permutation(G)
+    K_list = np.atleast_1d(np.asarray(capacities, dtype=float))
+    windows = np.asarray(windows, dtype=int)
+    n = len(G)
+
+    energy = np.empty((len(K_list), len(windows)))
+    for i, K in enumerate(K_list):
+        G_minus_K = (G - K).clip(min=0)
+        cumulative = np.append(0, np.cumsum(G_minus_K))
+        # Hours with G > K where the windows start.
+        qualified = np.nonzero(G_minus_K)[0]
+        start_sum = np.sum(cumulative[qualified])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for j, dt in enumerate(windows):
+                end_sum = np.sum(cumulative[np.minimum(qualified + dt, n)])
+                energy[i, j] = (end_sum - start_sum) / len(qualified)
+    return(energy)
+
 
 # --------------------------------------------------------------------------------------------------
+def _storage_increments(B, C, KB, eta_in, eta_out, KSPc, KSPd):
+    '''
+    Function that calculates the hourly change of the storage filling level before the storage is
+    clipped to be within [KSE, 0].
+
+    Charging and discharging power constraints only depend on the hour itself, so they can be
+    applied to the whole time series at once.
+
+    parameters:
+        B:           array | time series for the backup generation.
+        C:           array | time series for the curtailment.
+        KB:         number | backup capacity.
+        eta_in:     number | charging efficiency.
+        eta_out:    number | discharging efficiency.
+        KSPc:       number | maximum charging power (positive).
+        KSPd:       number | maximum discharging power (negative).
+    returns:
+        u:           array | the unclipped change in storage filling level.
+        discharging: array | boolean time series with True where the storage is discharging.
+    '''
+    K_C_B = KB + C - B
+    discharging = K_C_B < 0
+    u = np.where(discharging,
+                 np.maximum((eta_out ** - 1) * K_C_B, KSPd),
+                 np.minimum((eta_in) * K_C_B, KSPc))
+    return(u, discharging)
+
+
+def _clipped_cumsum(u, KSE, level=0.0):
+    '''
+    Function that calculates the storage filling level S[t] = min(0, max(KSE, S[t - 1] + u[t]))
+    with S[-1] = level.
+
+    Without a lower limit (KSE = -inf) this is a cumulative sum reset at every new maximum:
+    S[t] = P[t] - max(0, P[0], ..., P[t]) with P = cumsum(u), which is calculated without looping.
+    The result is the same up to rounding.
+
+    parameters:
+        u:     array | the unclipped change in storage filling level.
+        KSE:  number | the lowest allowed storage filling level (negative).
+        level: number | the storage filling level before the first hour. Only used with a lower
+                        limit.
+    returns:
+        S:   array | the storage filling level time series.
+    '''
+    if np.isneginf(KSE):
+        P = np.cumsum(u)
+        return(P - np.maximum(np.maximum.accumulate(P), 0))
+
+    S = []
+    append = S.append
+    level = float(level)
+    for du in u.tolist():
+        level += du
+        if level > 0:
+            level = 0.0
+        elif level < KSE:
+            level = KSE
+        append(level)
+    return(np.array(S, dtype=float))
+
+
 def storage_size(backup_without_storage,
                  backup_beta_capacity,
                  curtailment=np.array([]),
@@ -110,6 +276,16 @@ def storage_size(backup_without_storage,
     '''
     Function that calculates the storage time series.
 
+    The power constraints and efficiencies are applied to the whole time series at once, which
+    leaves a clipped cumulative sum to be calculated hour by hour. Gives the same results as the
+    hour by hour loop in tests/test_storage_size.py. Without an energy capacity the clipped
+    cumulative sum has a closed form, so e.g. the unconstrained lossless storage is found with
+    array operations only (with results equal up to rounding).
+
+    A 2-dimensional backup generation with shape (nodes, hours) gives a storage for each node.
+    The capacities and efficiencies can then be numbers or arrays with a value per node, and all
+    nodes are calculated in one pass over time with 'storage_size_batch'.
+
     parameters:
         backup_without_storage: sequence | time series for the backup generation
                                            in units of mean load.
@@ -125,8 +301,15 @@ def storage_size(backup_without_storage,
         S:         numpy array | storage filling level time series.
         B_storage: numpy array | the backup generation timeseries with a storage.
     '''
-    B = np.array(backup_without_storage)
-    B_storage = np.empty_like(backup_without_storage)
+    B = np.array(backup_without_storage, dtype=float)
+    if B.ndim == 2:
+        return(storage_size_batch(B, backup_beta_capacity,
+                                  curtailment=curtailment,
+                                  eta_in=eta_in,
+                                  eta_out=eta_out,
+                                  charging_capacity=charging_capacity,
+                                  discharging_capacity=discharging_capacity,
+                                  energy_capacity=energy_capacity))
     KB = backup_beta_capacity
     KSPc = charging_capacity
     KSPd = - discharging_capacity
@@ -134,50 +317,367 @@ def storage_size(backup_without_storage,
 
     # Check if curtailment is not zero - i.e. we consider curtailment.
     if curtailment.any():
-        C = np.array(curtailment)
+        C = np.array(curtailment, dtype=float)
     else:
         C = np.zeros_like(B)
 
     # The initial maximum level of the emergency storage.
     S_max = 0
+    u, discharging = _storage_increments(B, C, KB, eta_in, eta_out, KSPc, KSPd)
     # The storage filling level time series.
-    S = np.empty_like(B)
-
-    for t, (b, c) in enumerate(zip(B, C)):
-        K_C_B = KB + c - b
-        if K_C_B < 0: # If the backup > capacity + curtailment = discharging storage
-            if t == 0:
-                s = np.min((S_max, (eta_out ** - 1) * K_C_B))
-                S[t] = np.max((s, KSPd, KSE))
-            else:
-                s = np.min((S_max, S[t - 1] + (eta_out ** - 1) * K_C_B))
-                S[t] = np.max((s, KSPd + S[t - 1], KSE))
-            B_storage[t] = KB
-        else: # If backup < capacity + curtailment = charging storage
-            if t == 0:
-                s = np.min((S_max, (eta_in) * K_C_B))
-                S[t] = np.min((s, KSPc))
-            else:
-                s = np.min((S_max, S[t - 1] + (eta_in) * K_C_B))
-                S[t] = np.min((s, KSPc + S[t - 1]))
-            B_storage[t] = np.min((KB, b + np.abs(S[t]), b + KSPc))
-
-        # Calculate the new backup generation time series
-        # if b > KB: # If backup generation is bigger than capacity
-        #     B_storage[t] = KB
-        # else: # Backup generation is lower than capacity
-        #     if np.abs(S[t]) > KB - b:
-        #         B_storage[t] = KB
-        #     else:
-        #         B_storage[t] = b + np.abs(S[t])
-
-#         B_storage[t] = np.min((KB, b + np.abs(S[t])))
+    S = _clipped_cumsum(u, KSE)
+
+    # The backup generation is at capacity when discharging and is otherwise raised to recharge
+    # the storage, limited by the capacity and the charging power.
+    B_storage = np.where(discharging, KB, np.minimum(np.minimum(KB, B + np.abs(S)), B + KSPc))
 
     # Storage energy capacity
     K_SE = S_max - np.min(S)
 
     return(K_SE, S, B_storage)
 
+
+def storage_size_relative(backup_without_storage, backup_beta_capacity, eta=1):
+    '''
+    Function that calculates the storage needed to keep the backup generation below the backup
+    capacity, without any constraints on the storage.
+
+    parameters:
+        backup_without_storage: sequence | time series for the backup generation
+                                           in units of mean load.
+        backup_beta_capacity:     number | backup capacity in units of mean load.
+        eta:      number between 0 and 1 | round-trip efficiency of the storage. The losses are
+                                           taken when charging.
+    returns:
+        K_SE: number | storage energy capacity i.e. lowest point in storage time series.
+        S:     array | storage filling level time series.
+    '''
+    (K_SE, S, B_storage) = storage_size(backup_without_storage,
+                                        backup_beta_capacity,
+                                        eta_in=eta,
+                                        eta_out=1.0)
+    return(K_SE, S)
+
+
+def _clipped_cumsum_batch(u, KSE, level):
+    '''
+    Function that calculates the storage filling level for several storages at once. Same as
+    '_clipped_cumsum' with the storages along the second axis.
+
+    parameters:
+        u:     array | the unclipped change in storage filling level with shape (hours, storages).
+        KSE:   array | the lowest allowed storage filling level for each storage (negative).
+        level: array | the storage filling level before the first hour. Updated in place.
+    returns:
+        S:     array | the storage filling level time series with shape (hours, storages).
+    '''
+    if np.all(np.isneginf(KSE)):
+        # Cumulative sum reset at every new maximum as in '_clipped_cumsum'.
+        P = level + np.cumsum(u, axis=0)
+        S = P - np.maximum(np.maximum.accumulate(P, axis=0), 0)
+        if len(S):
+            level[:] = S[-1]
+        return(S)
+
+    S = np.empty_like(u)
+    for t in range(len(u)):
+        np.add(level, u[t], out=level)
+        np.maximum(level, KSE, out=level)
+        np.minimum(level, 0, out=level)
+        S[t] = level
+    return(S)
+
+
+StorageObjectives = namedtuple('StorageObjectives', ['K_SE',
+                                                     'K_SPc',
+                                                     'K_SPd',
+                                                     'BE',
+                                                     'E_NS',
+                                                     'E_NS_hours'])
+
+
+def storage_size_batch(backup_without_storage,
+                       backup_beta_capacity,
+                       curtailment=np.array([]),
+                       eta_in=1.0,
+                       eta_out=1.0,
+                       charging_capacity=np.inf,
+                       discharging_capacity=np.inf,
+                       energy_capacity=np.inf,
+                       return_timeseries=True,
+                       S_reference=None,
+                       chunk_hours=2000):
+    '''
+    Function that calculates the storage for many sets of parameters with one pass over the
+    backup generation time series. The parameters can be numbers or arrays and are broadcast
+    against each other - each element is one storage calculated as in 'storage_size'.
+
+    The backup generation (and curtailment) can also be 2-dimensional with one row per storage,
+    e.g. one row per node, with the parameters given per row.
+
+    The time series is handled in chunks of 'chunk_hours', so with 'return_timeseries=False' the
+    memory used only depends on the chunk size and the number of parameter sets.
+
+    parameters:
+        backup_without_storage: sequence | time series for the backup generation
+                                           in units of mean load. Shape (hours,) or (sets, hours).
+        backup_beta_capacity:      array | backup capacities in units of mean load.
+        curtailment:               array | time series for the curtailment with the same shape as
+                                           the backup generation. Can be omitted.
+        eta_in:                    array | charging efficiencies.
+        eta_out:                   array | discharging efficiencies.
+        charging_capacity:         array | the maximum allowed charging capacities.
+        discharging_capacity:      array | the maximum allowed discharging capacities.
+        energy_capacity:           array | the maximum allowed storage energy capacities.
+        return_timeseries:       boolean | whether to return the time series or only the objectives.
+        S_reference:               array | storage filling level time series to calculate the
+                                           non-served storage energy against as in
+                                           'get_non_served_storage_energy'. Shape (hours,) or
+                                           (sets, hours). Can be omitted.
+        chunk_hours:             integer | number of hours handled at once.
+    returns:
+        If return_timeseries is True:
+            K_SE:      numpy array | storage energy capacities with shape (sets,).
+            S:         numpy array | storage filling levels with shape (sets, hours).
+            B_storage: numpy array | backup generation with a storage with shape (sets, hours).
+        Else a StorageObjectives namedtuple with arrays of shape (sets,):
+            K_SE, K_SPc, K_SPd: as in 'get_objectives'.
+            BE:                 the total backup energy with a storage.
+            E_NS, E_NS_hours:   as in 'get_non_served_storage_energy' - None without S_reference.
+    '''
+    B = np.array(backup_without_storage, dtype=float)
+    nhours = B.shape[-1]
+    # A 2-dimensional backup generation has one row per storage.
+    rows = np.ones(len(B)) if B.ndim == 2 else np.ones(1)
+    parameters = np.broadcast_arrays(rows, *[np.atleast_1d(np.array(p, dtype=float))
+                                             for p in (backup_beta_capacity,
+                                                       eta_in,
+                                                       eta_out,
+                                                       charging_capacity,
+                                                       discharging_capacity,
+                                                       energy_capacity)])[1:]
+    (KB, eta_in, eta_out, KSPc, KSPd, KSE) = [np.array(p.ravel()) for p in parameters]
+    KSPd = - KSPd
+    KSE = - KSE
+    sets = len(KB)
+
+    # Check if curtailment is not zero - i.e. we consider curtailment.
+    if curtailment.any():
+        C = np.array(curtailment, dtype=float)
+    else:
+        C = np.zeros_like(B)
+
+    if return_timeseries:
+        S = np.empty((sets, nhours))
+        B_storage = np.empty((sets, nhours))
+    else:
+        S_min = np.zeros(sets)
+        diff_max = np.full(sets, - np.inf)
+        diff_min = np.full(sets, np.inf)
+        BE = np.zeros(sets)
+        if S_reference is not None:
+            S_reference = np.array(S_reference, dtype=float)
+            E_NS = np.zeros(sets)
+            E_NS_hours = np.zeros(sets, dtype=int)
+
+    # The storage filling levels carried from one chunk to the next.
+    level = np.zeros(sets)
+    S_last = None
+    for start in range(0, nhours, chunk_hours):
+        stop = min(start + chunk_hours, nhours)
+        b = B[..., start:stop].T.reshape(stop - start, -1)
+        c = C[..., start:stop].T.reshape(stop - start, -1)
+        u, discharging = _storage_increments(b, c, KB, eta_in, eta_out, KSPc, KSPd)
+        S_chunk = _clipped_cumsum_batch(u, KSE, level)
+        B_chunk = np.where(discharging, KB, np.minimum(np.minimum(KB, b + np.abs(S_chunk)), b + KSPc))
+
+        if return_timeseries:
+            S[:, start:stop] = S_chunk.T
+            B_storage[:, start:stop] = B_chunk.T
+            continue
+
+        np.minimum(S_min, S_chunk.min(axis=0), out=S_min)
+        BE += B_chunk.sum(axis=0)
+        # Differences between consecutive hours, including the last hour of the previous chunk.
+        if S_last is None:
+            diff = np.diff(S_chunk, axis=0)
+        else:
+            diff = np.diff(np.vstack((S_last, S_chunk)), axis=0)
+        S_last = S_chunk[-1]
+        if len(diff):
+            np.maximum(diff_max, diff.max(axis=0), out=diff_max)
+            np.minimum(diff_min, diff.min(axis=0), out=diff_min)
+
+        if S_reference is not None:
+            first = max(start - 1, 0)
+            diff0 = np.diff(S_reference[..., first:stop]).T.reshape(stop - first - 1, -1).clip(max=0)
+            diff1 = diff.clip(max=0) * eta_out
+            E_NS_chunk = -(diff0 - diff1).clip(max=0)
+            E_NS_chunk[np.abs(E_NS_chunk) < 1e-10] = 0
+            E_NS += E_NS_chunk.sum(axis=0)
+            E_NS_hours += np.count_nonzero(E_NS_chunk, axis=0)
+
+    if return_timeseries:
+        K_SE = - np.min(S, axis=1)
+        return(K_SE, S, B_storage)
+
+    return(StorageObjectives(K_SE=- S_min,
+                             K_SPc=diff_max / eta_in,
+                             K_SPd=- diff_min * eta_out,
+                             BE=BE,
+                             E_NS=E_NS if S_reference is not None else None,
+                             E_NS_hours=E_NS_hours if S_reference is not None else None))
+
+
+class StorageSimulator():
+    '''
+    Class to calculate a storage from a backup generation time series handed over in chunks, e.g.
+    from a generator or a memory-mapped array, with the same physics as 'storage_size'.
+
+    The state at the end of each chunk is carried over to the next, so only one chunk has to be in
+    memory at a time. The storage energy capacity after the last chunk is exactly the same as
+    from 'storage_size' on the whole time series.
+
+    Example
+    -------
+    simulator = StorageSimulator(0.7, eta_in=0.8, eta_out=0.62)
+    for S, B_storage in simulator.run(np.load('backup.npy', mmap_mode='r')):
+        ...
+    K_SE = simulator.K_SE
+    '''
+    def __init__(self,
+                 backup_beta_capacity,
+                 eta_in=1.0,
+                 eta_out=1.0,
+                 charging_capacity=np.inf,
+                 discharging_capacity=np.inf,
+                 energy_capacity=np.inf):
+        '''
+        parameters:
+            backup_beta_capacity:     number | backup capacity in units of mean load.
+            eta_in:   number between 0 and 1 | charging efficiency.
+            eta_out:  number between 0 and 1 | discharging efficiency.
+            charging_capacity:        number | the maximum allowed charging capacity.
+            discharging_capacity:     number | the maximum allowed discharging capacity.
+            energy_capacity:          number | the maximum allowed storage energy capacity.
+        '''
+        self.KB = backup_beta_capacity
+        self.eta_in = eta_in
+        self.eta_out = eta_out
+        self.KSPc = charging_capacity
+        self.KSPd = - discharging_capacity
+        self.KSE = - energy_capacity
+        self.reset()
+
+    def reset(self):
+        # Storage filling level after the last hour fed.
+        self.level = 0.0
+        # Without an energy capacity the storage is a cumulative sum minus its running maximum.
+        # These are carried instead of the level so the sums are the same as for the whole array.
+        self.P_last = 0.0
+        self.P_max = 0.0
+        # Lowest storage filling level so far and number of hours fed.
+        self.S_min = np.inf
+        self.nhours = 0
+
+    @property
+    def K_SE(self):
+        # Storage energy capacity i.e. lowest point in storage time series so far.
+        return(0 - self.S_min if self.nhours > 0 else 0.0)
+
+    def feed(self, backup_chunk, curtailment_chunk=None):
+        '''
+        Calculate the storage for the next chunk of hours.
+
+        The state is one storage, so the chunks have to be 1-dimensional - use 'storage_size' or
+        'storage_size_batch' for one storage per node.
+
+        parameters:
+            backup_chunk:      array | the backup generation for the next hours.
+            curtailment_chunk: array | the curtailment for the same hours. Can be omitted.
+        returns:
+            S:         numpy array | storage filling level for the hours.
+            B_storage: numpy array | the backup generation with a storage for the hours.
+        '''
+        B = np.array(backup_chunk, dtype=float)
+        if curtailment_chunk is None:
+            C = np.zeros_like(B)
+        else:
+            C = np.array(curtailment_chunk, dtype=float)
+        if B.ndim != 1 or C.shape != B.shape:
+            raise ValueError('The chunks must be 1-dimensional time series of the same length, '
+                             'got shapes {0} and {1}.'.format(B.shape, C.shape))
+
+        u, discharging = _storage_increments(B, C, self.KB, self.eta_in, self.eta_out,
+                                             self.KSPc, self.KSPd)
+        if len(u) == 0:
+            return(np.empty(0), np.empty(0))
+
+        if np.isneginf(self.KSE):
+            P = np.cumsum(np.append(self.P_last, u))[1:]
+            P_max = np.maximum.accumulate(np.append(self.P_max, P))[1:]
+            S = P - P_max
+            self.P_last = P[-1]
+            self.P_max = P_max[-1]
+        else:
+            S = _clipped_cumsum(u, self.KSE, level=self.level)
+        self.level = S[-1]
+        self.S_min = min(self.S_min, np.min(S))
+        self.nhours += len(S)
+
+        B_storage = np.where(discharging, self.KB,
+                             np.minimum(np.minimum(self.KB, B + np.abs(S)), B + self.KSPc))
+        return(S, B_storage)
+
+    def run(self, backup, curtailment=None, chunk_hours=24 * 365):
+        '''
+        Generator calculating the storage chunk by chunk.
+
+        parameters:
+            backup:      array or iterable | the backup generation as an array (e.g. memory-mapped)
+                                             which is read in chunks of 'chunk_hours', or as an
+                                             iterable of chunks.
+            curtailment: array or iterable | the curtailment in the same form. Can be omitted.
+            chunk_hours:           integer | number of hours read at a time from an array.
+        yields:
+            (S, B_storage) for each chunk as returned by 'feed'.
+        '''
+        backup_chunks = iterate_chunks(backup, chunk_hours)
+        if curtailment is None:
+            for backup_chunk in backup_chunks:
+                yield(self.feed(backup_chunk))
+        else:
+            curtailment_chunks = iterate_chunks(curtailment, chunk_hours)
+            for backup_chunk, curtailment_chunk in zip(backup_chunks, curtailment_chunks):
+                yield(self.feed(backup_chunk, curtailment_chunk))
+
+
+def iterate_chunks(timeseries, chunk_hours):
+    '''
+    Generator going through a 1-dimensional time series in chunks of hours. Iterables that are
+    not arrays, e.g. generators, are taken to be chunks already and are passed through.
+
+    parameters:
+        timeseries:   array or iterable | the time series, e.g. a memory-mapped array.
+        chunk_hours:            integer | number of hours in each chunk.
+    yields:
+        chunk: array | the next chunk of the time series.
+    '''
+    if isinstance(timeseries, (list, tuple)):
+        # A list would be gone through one hour at a time.
+        raise TypeError('Give the time series as an array or as an iterable of chunks, not as a '
+                        'list.')
+    if not isinstance(timeseries, np.ndarray):
+        for chunk in timeseries:
+            yield(chunk)
+        return
+    if timeseries.ndim != 1:
+        raise ValueError('The time series must be 1-dimensional, got shape '
+                         '{0}.'.format(timeseries.shape))
+    for start in range(0, len(timeseries), chunk_hours):
+        yield(timeseries[start:start + chunk_hours])
+
+
 def convert_to_exp_notation(number, print_it=False):
     n = '{:.2E}'.format(number)
     if print_it:
@@ -238,29 +738,77 @@ def find_minima(timeseries):
     returns:
         minima: list | a list of the minima in the clustered events.
     '''
-    intervals = []
-    interval = []
-    minima = []
+    return(find_events(timeseries).depth)
 
-    nonzero = np.nonzero(timeseries)[0]
-    diff = np.diff(nonzero)
 
-    for i, d in enumerate(diff):
-        interval.append(nonzero[i])
-        if d != 1:
-            intervals.append(interval)
-            interval = []
+Events = namedtuple('Events', ['series',
+                               'start',
+                               'end',
+                               'duration',
+                               'depth',
+                               'energy',
+                               'time_of_minimum'])
 
-    if nonzero[-1] - nonzero[-2] == 1:
-        interval.append(nonzero[-1])
-        intervals.append(interval)
-    else:
-        intervals.append([nonzero[-1]])
 
-    for interval in intervals:
-        minima.append(np.min(timeseries[interval]))
+def find_events(timeseries):
+    '''
+    Function that finds every connected event of nonzero values in one or more timeseries, e.g.
+    the dips of a storage filling level or the hours with non-served energy.
+
+    The events are found from where the nonzero mask changes, and the values in each event are
+    reduced with np.ufunc.reduceat, so nothing loops over the hours.
+
+    parameters:
+        timeseries: array | a timeseries or an array of timeseries with shape (series, hours).
+    returns:
+        events: Events namedtuple with an array for each of:
+            series:          the index of the timeseries the event belongs to (0 for one timeseries).
+            start:           the first hour of the event.
+            end:             the last hour of the event.
+            duration:        the number of hours in the event.
+            depth:           the minimum value in the event.
+            energy:          the sum of the values in the event.
+            time_of_minimum: the first hour with the minimum value.
+    '''
+    data = np.atleast_2d(np.asarray(timeseries, dtype=float))
+    (rows, nhours) = data.shape
+
+    # Padding with zeros on both sides so events never continue from one timeseries to the next.
+    nonzero = np.zeros((rows, nhours + 2), dtype=np.int8)
+    nonzero[:, 1:-1] = data != 0
+    edges = np.diff(nonzero, axis=1)
+    (series, start) = np.nonzero(edges == 1)
+    end_exclusive = np.nonzero(edges == -1)[1]
+    duration = end_exclusive - start
+
+    # Reducing over [start, end) of each event in the flattened data - every second reduction is
+    # the gap between two events.
+    flat = np.append(data.ravel(), 0)
+    bounds = np.empty(2 * len(start), dtype=int)
+    bounds[0::2] = series * nhours + start
+    bounds[1::2] = series * nhours + end_exclusive
+    if len(start):
+        depth = np.minimum.reduceat(flat, bounds)[0::2]
+        energy = np.add.reduceat(flat, bounds)[0::2]
+    else:
+        depth = np.empty(0)
+        energy = np.empty(0)
+
+    # First hour in each event where the value equals the depth of the event.
+    labels = np.repeat(np.arange(len(start)), duration)
+    hours = np.nonzero(nonzero[:, 1:-1].ravel())[0]
+    at_minimum = flat[hours] == depth[labels]
+    first = np.unique(labels[at_minimum], return_index=True)[1]
+    time_of_minimum = hours[at_minimum][first] - series * nhours
+
+    return(Events(series=series,
+                  start=start,
+                  end=end_exclusive - 1,
+                  duration=duration,
+                  depth=depth,
+                  energy=energy,
+                  time_of_minimum=time_of_minimum))
 
-    return(np.array(minima))
 
 def annuity(n, r):
     '''
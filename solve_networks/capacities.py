@@ -0,0 +1,110 @@
+'''
+Link capacities h0 from the copperflows, kept in small tables next to them.
+
+h0 of a link is a quantile of the absolute unconstrained flow on it. Instead of reading the whole
+copperflow (links x hours) every time h0 is needed, the quantiles in 's.h0_quantiles' and any other
+quantile asked for are found for all the links at once and saved in '<copperflow>_h0.npz' with
+the arrays 'quantiles' and 'caps' (quantiles, links). A table is remade when a quantile it does
+not have is asked for or when the copperflow file is newer than it.
+
+The caps are symmetric, one per link, as used by 'qp.py' and the figures. The DC-solver gets its
+h0 from 'regions.tools.get_quant_caps' instead (see get_h0 in 'solve_single_network.py').
+
+A square copperflow that is not on disk is put together from the basis flows in
+'superposition.py', and only its table is saved.
+
+Example
+-------
+h0 = get_caps(0.80, 1.00, quant=0.99)
+table = read_table(s.copper_fullname.format(0.80, 1.00))
+'''
+import os
+from collections import namedtuple
+import numpy as np
+import settings.settings as s
+import settings.tools as t
+import solve_networks.superposition as sp
+
+
+CapsTable = namedtuple('CapsTable', ['quantiles', 'caps'])
+
+# Tables already read in this process, keyed by copperflow file.
+_tables = {}
+
+
+def table_fullname(copper_name):
+    # The table is saved next to its copperflow.
+    return copper_name[:-len('.npy')] + '_h0.npz'
+
+
+def get_quant_caps(quantile_list, flows, method='histogram'):
+    '''
+    The quantiles of the absolute flow of every link, found for all links and quantiles at once.
+
+    parameters:
+        quantile_list: list | e.g. (0.99, 0.999).
+        flows:        array | shape (links, hours).
+    returns:
+        array | shape (quantiles, links).
+    '''
+    return t.quantiles(np.atleast_1d(quantile_list), np.abs(flows), method=method)
+
+
+def _rounded(quantile_list):
+    # Quantiles are compared with six decimals.
+    return np.round(np.atleast_1d(np.asarray(quantile_list, dtype=float)), 6)
+
+
+def read_table(copper_name, quantile_list=s.h0_quantiles, a=None, g=None):
+    '''
+    The table of a copperflow with at least the quantiles in 'quantile_list', made if needed. The
+    flows are read from the copperflow file, or put together from the basis flows for alpha 'a'
+    and gamma 'g' when there is no file (square flows only).
+
+    returns:
+        CapsTable | sorted quantiles and the caps with shape (quantiles, links).
+    '''
+    table_name = table_fullname(copper_name)
+    needed = _rounded(quantile_list)
+    table = _tables.get(copper_name)
+    if table is None and os.path.isfile(table_name):
+        if (not os.path.isfile(copper_name)
+                or os.path.getmtime(copper_name) <= os.path.getmtime(table_name)):
+            with np.load(table_name) as data:
+                table = CapsTable(quantiles=data['quantiles'], caps=data['caps'])
+    if table is None or not np.all(np.isin(needed, table.quantiles)):
+        quantiles = np.union1d(needed, _rounded(s.h0_quantiles))
+        if table is not None:
+            quantiles = np.union1d(quantiles, table.quantiles)
+        if os.path.isfile(copper_name):
+            flows = np.load(copper_name, mmap_mode='r')
+        elif a is not None and g is not None:
+            flows = sp.copper_flow(a, g)
+        else:
+            raise IOError('No copperflow file {0}.'.format(copper_name))
+        table = CapsTable(quantiles=quantiles, caps=get_quant_caps(quantiles, flows))
+        folder = os.path.dirname(table_name)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        # Saving to a temporary file first, so other processes never see a half written file.
+        temp_name = '{0}.{1}.tmp.npz'.format(table_name, os.getpid())
+        np.savez(temp_name, **table._asdict())
+        os.replace(temp_name, table_name)
+    _tables[copper_name] = table
+    return table
+
+
+def get_h0(copper_name, quant=0.99, a=None, g=None):
+    # The caps of one quantile from the table of a copperflow, shape (links,).
+    table = read_table(copper_name, [quant], a, g)
+    return table.caps[np.searchsorted(table.quantiles, _rounded(quant)[0])]
+
+
+def get_caps(a, g, quant=0.99, mode='square'):
+    '''
+    h0 for alpha and gamma in the square or linear flow scheme. Square flows need no copperflow
+    file, linear flows do.
+    '''
+    if 'square' in mode:
+        return get_h0(s.copper_fullname.format(a, g), quant, a, g)
+    return get_h0(s.copper_fullname_linear.format(a, g), quant)
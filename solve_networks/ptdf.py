@@ -0,0 +1,86 @@
+'''
+Unconstrained DC flow in the square (synchronized) flow scheme without an iterative solver.
+
+Without link constraints the square flow is the least squares solution of K F = P, with K the
+incidence matrix of the network in 'settings/eadmat.txt' and P the injections in each hour. For
+all hours at once it is one matrix product with the PTDF matrix
+    F = K^T (K K^T)^+ P
+which is made once for each adjacency matrix.
+
+The flows have the same layout as the ones saved by 'Data' in results/F/: one row per link in the
+order of settings.link_list and one column per hour.
+'''
+import numpy as np
+import settings.settings as s
+import settings.iset as iset
+
+
+admat_fullname = './settings/eadmat.txt'
+
+# Incidence and PTDF matrices already made, keyed by adjacency matrix file.
+_matrices = {}
+
+
+def incidence_matrix(admat=admat_fullname):
+    '''
+    The incidence matrix K with a column for each link. Links are ordered as in aurespf: by the
+    first country and then by the second, which is the order of settings.link_list. A link from
+    country j to country i has K[j, l] = 1 and K[i, l] = -1.
+    '''
+    A = np.genfromtxt(admat)
+    (j, i) = np.nonzero(np.triu(A + A.T, k=1))
+    K = np.zeros((len(A), len(j)))
+    K[j, np.arange(len(j))] = 1
+    K[i, np.arange(len(j))] = -1
+    return K
+
+
+def ptdf_matrix(admat=admat_fullname):
+    # The PTDF matrix K^T (K K^T)^+ with shape (links, nodes). Made once per adjacency matrix.
+    if admat not in _matrices:
+        K = incidence_matrix(admat)
+        _matrices[admat] = np.dot(K.T, np.linalg.pinv(np.dot(K, K.T)))
+    return _matrices[admat]
+
+
+def mismatch(a, g, countries=s.countries):
+    '''
+    The mismatch and the load in MW of all the countries from the ISET data, as in the nodes of
+    aurespf: mismatch = gamma * <L> * (alpha * Gw + (1 - alpha) * Gs) - L.
+
+    returns:
+        (mismatch, load): arrays of shape (countries, hours).
+    '''
+    load = 1000 * np.array(iset.get_all('L', countries=countries))
+    mean_load = np.mean(load, axis=1, keepdims=True)
+    Gw = iset.get_all('Gw', countries=countries)
+    Gs = iset.get_all('Gs', countries=countries)
+    return (g * mean_load * (a * Gw + (1 - a) * Gs) - load, load)
+
+
+def synchronized_injections(mismatch, load):
+    '''
+    The injections when the European mismatch is shared between the countries in proportion to
+    their mean load: P_n = Delta_n - <L_n> / <L_EU> * Delta_EU.
+    '''
+    mean_load = np.mean(load, axis=-1)
+    weights = mean_load / np.sum(mean_load)
+    return mismatch - np.outer(weights, np.sum(mismatch, axis=0))
+
+
+def copper_flow(mismatch, load, admat=admat_fullname):
+    '''
+    The unconstrained square flow for all hours.
+
+    parameters:
+        mismatch: array | shape (nodes, hours) in the order of the adjacency matrix.
+        load:     array | shape (nodes, hours).
+    returns:
+        F: array | shape (links, hours), the layout of the files in results/F/.
+    '''
+    return np.dot(ptdf_matrix(admat), synchronized_injections(mismatch, load))
+
+
+def solve_copper_flow(a, g, admat=admat_fullname):
+    # The copper flow for alpha and gamma straight from the ISET data.
+    return copper_flow(*mismatch(a, g), admat=admat)
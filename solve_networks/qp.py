@@ -0,0 +1,300 @@
+'''
+Constrained DC flow with the link capacities b * h0, solved in the repository for blocks of hours.
+
+Every hour is solved on the network in 'settings/eadmat.txt' with the flows kept inside the box
+-b * h0 <= F <= b * h0, in the same order of objectives as the DC-solver:
+
+    1. The least total balancing. This is a linear program, solved for a block of hours at once
+       with scipy's HiGHS. All the flows with the least balancing are the flows where the
+       variables with a nonzero reduced cost in the program stay at their bound, i.e. some links
+       stay at their capacity and some countries can only have balancing, only curtailment or
+       neither. The later steps keep to that set.
+    2. square: what is left in each country, r = Delta - K F, as close as possible to its mean load
+               share of the European mismatch (the synchronized split):
+               min 1/2 ||r - w Delta_EU||^2.
+       linear: no second step.
+    3. The smallest flows, min 1/2 ||F||^2, with r from step 2 (square) or any r of step 1 (linear).
+
+Steps 2 and 3 are solved for all the hours of a block at once with primal-dual (Chambolle-Pock)
+iterations, where every step is a few matrix products. In the square flow, hours where the
+unconstrained flow from the PTDF matrix is inside the box already have the least balancing and the
+synchronized split, so they are not solved.
+
+The results are recorded as solver 'qp' in the catalog of solved networks. They have not been
+compared with networks solved by the DC-solver - run 'benchmark' on some of them before using
+this solver in their place.
+
+Example
+-------
+solution = constrained_flow(mismatch, load, h0, b=0.5)
+benchmark(0.80, 1.00, 0.50)
+'''
+import time
+from collections import namedtuple
+import numpy as np
+import scipy.sparse as sps
+from scipy.optimize import linprog
+import settings.settings as s
+import solve_networks.ptdf as ptdf
+import solve_networks.capacities as cap
+
+
+FlowSolution = namedtuple('FlowSolution', ['F', 'balancing', 'curtailment', 'iterations'])
+Face = namedtuple('Face', ['F', 'F_lower', 'F_upper', 'r_lower', 'r_upper'])
+Benchmark = namedtuple('Benchmark', ['seconds', 'balancing_max_error', 'balancing_energy_error',
+                                     'balancing_hours_higher', 'balancing_max_excess',
+                                     'flow_max_error'])
+
+
+def least_balancing(K, mismatch, caps, lp_hours=250, tol=1e-7):
+    '''
+    Step 1: the flows with the least total balancing for every hour (column of 'mismatch'), and
+    the bounds of the set of all the flows with the least balancing.
+
+    The variables of an hour are the flows, the curtailment and the balancing with
+    K F + curtailment - balancing = mismatch. The hours are independent, so 'lp_hours' of them
+    are solved as one linear program. Flows, curtailment or balancing with a reduced cost above
+    'tol' have to stay where they are in every solution with the least balancing.
+
+    returns:
+        Face | the flows, their bounds and the bounds of r = mismatch - K F (nodes, hours).
+    '''
+    (nodes, links) = K.shape
+    nhours = mismatch.shape[1]
+    caps = np.asarray(caps, dtype=float)
+    A_hour = sps.hstack([sps.csr_matrix(K), sps.identity(nodes), -sps.identity(nodes)])
+    cost_hour = np.r_[np.zeros(links + nodes), np.ones(nodes)]
+    bounds_hour = np.c_[np.r_[-caps, np.zeros(2 * nodes)], np.r_[caps, np.full(2 * nodes, np.inf)]]
+    x = np.empty((links + 2 * nodes, nhours))
+    fixed = np.empty(x.shape, dtype=bool)
+    for start in range(0, nhours, lp_hours):
+        stop = min(start + lp_hours, nhours)
+        n = stop - start
+        result = linprog(np.tile(cost_hour, n),
+                         A_eq=sps.kron(sps.identity(n), A_hour, format='csr'),
+                         b_eq=mismatch[:, start:stop].T.ravel(),
+                         bounds=np.tile(bounds_hour, (n, 1)),
+                         method='highs')
+        if result.status != 0:
+            raise RuntimeError('Least balancing of hours {0} to {1}: {2}'.format(start, stop,
+                                                                                 result.message))
+        x[:, start:stop] = result.x.reshape(n, -1).T
+        fixed[:, start:stop] = (np.maximum(np.abs(result.lower.marginals),
+                                           np.abs(result.upper.marginals)) > tol).reshape(n, -1).T
+    F = x[:links]
+    # A curtailment kept at zero leaves r <= 0 and a balancing kept at zero leaves r >= 0.
+    return Face(F=F,
+                F_lower=np.where(fixed[:links], F, -caps[:, None]),
+                F_upper=np.where(fixed[:links], F, caps[:, None]),
+                r_lower=np.where(fixed[links + nodes:], 0, -np.inf),
+                r_upper=np.where(fixed[links:links + nodes], 0, np.inf))
+
+
+def face_qp(K, mismatch, face, target=None, F0=None, tol=1e-6, max_iter=20000, check_every=10):
+    '''
+    Steps 2 and 3 for all the hours at once: with r = mismatch - K F and F and r inside the bounds
+    in 'face', solves
+        min 1/2 ||r - target||^2   if a target is given (only r is unique), or
+        min 1/2 ||F||^2            without a target.
+    Chambolle-Pock iterations with r as the dual side. Every hour is left out of the iterations
+    when it has converged.
+
+    parameters:
+        target:     array | (nodes, hours), e.g. the synchronized split of the European mismatch.
+        F0:         array | starting flows (links, hours), e.g. the solution for a smaller beta.
+        tol:       number | an hour has converged when F and r are that close to the optimality
+                            conditions with the dual variables Y, in units of tol * max|mismatch|:
+                            F and r stay where a projected gradient step leaves them, and r is
+                            that close to its bounds summed over the nodes, so the balancing is at
+                            most that much above the least balancing.
+        check_every: integer | iterations between the convergence checks.
+    returns:
+        (F, iterations)
+    '''
+    tau = sigma = 0.99 / np.linalg.norm(K, 2)
+    (weight, eps) = (0.0, 1.0) if target is None else (1.0, 0.0)
+    if target is None:
+        target = np.zeros_like(mismatch)
+    tol_abs = tol * max(1.0, np.max(np.abs(mismatch))) if mismatch.size else tol
+    F = np.clip(face.F if F0 is None else F0, face.F_lower, face.F_upper)
+    F_out = F.copy()
+    # The hours still iterated with their data, flows, extrapolated flows and dual variables.
+    hours = np.arange(mismatch.shape[1])
+    (D, q, F_lower, F_upper, r_lower, r_upper) = (mismatch, target, face.F_lower, face.F_upper,
+                                                  face.r_lower, face.r_upper)
+    F_bar = F.copy()
+    Y = np.zeros_like(D)
+    iteration = 0
+    while len(hours) > 0 and iteration < max_iter:
+        iteration += 1
+        V = Y - sigma * np.dot(K, F_bar)
+        r = np.clip((weight * q + sigma * D + V) / (weight + sigma), r_lower, r_upper)
+        Y = V - sigma * (r - D)
+        F_new = np.clip((F + tau * np.dot(K.T, Y)) / (1 + tau * eps), F_lower, F_upper)
+        F_bar = 2 * F_new - F
+        F = F_new
+        if iteration % check_every:
+            continue
+        # The optimality conditions: r = clip(target + Y) with a target and Y only pushing r
+        # against its bounds without, F = clip(K^T Y) for the smallest flows and K^T Y only
+        # pushing F against its bounds otherwise.
+        r = D - np.dot(K, F)
+        KY = np.dot(K.T, Y)
+        if weight:
+            (r_step, F_step) = (q + Y, F + KY)
+        else:
+            (r_step, F_step) = (r + Y, KY)
+        residual = np.maximum(np.max(np.abs(r - np.clip(r_step, r_lower, r_upper)), axis=0),
+                              np.max(np.abs(F - np.clip(F_step, F_lower, F_upper)), axis=0))
+        outside = np.sum(np.abs(r - np.clip(r, r_lower, r_upper)), axis=0)
+        converged = np.maximum(residual, outside) < tol_abs
+        if np.any(converged):
+            F_out[:, hours[converged]] = F[:, converged]
+            keep = ~converged
+            hours = hours[keep]
+            (D, q, F_lower, F_upper, r_lower, r_upper, F, F_bar, Y) = (
+                x[:, keep] for x in (D, q, F_lower, F_upper, r_lower, r_upper, F, F_bar, Y))
+    F_out[:, hours] = F
+    return (F_out, iteration)
+
+
+def _outside(K, mismatch, F, face):
+    # How far r = mismatch - K F is outside its bounds in each hour, summed over the nodes.
+    r = mismatch - np.dot(K, F)
+    return np.sum(np.abs(r - np.clip(r, face.r_lower, face.r_upper)), axis=0)
+
+
+def constrained_flow(mismatch, load, h0, b, mode='square', F0=None, block_hours=8760,
+                     admat=ptdf.admat_fullname, lp_hours=250, **kwargs):
+    '''
+    The constrained flow, balancing and curtailment for all hours.
+
+    parameters:
+        mismatch:     array | (nodes, hours) in MW.
+        load:         array | (nodes, hours) in MW.
+        h0:           array | link capacities for b = 1, (links,).
+        b:           number | beta, the scaling of h0.
+        mode:        string | 'square' or 'linear'.
+        F0:           array | starting flows (links, hours), e.g. the solution for a smaller beta.
+        block_hours: integer | hours solved at a time.
+        lp_hours:    integer | hours in each linear program of step 1.
+    returns:
+        FlowSolution with F (links, hours), balancing and curtailment (nodes, hours) and the
+        largest number of iterations in a block.
+
+    Hours that have not converged within the iterations of a step keep the flows of the step
+    before, so the balancing is always the least balancing up to the tolerance.
+    '''
+    K = ptdf.incidence_matrix(admat)
+    tol = kwargs.get('tol', 1e-6)
+    caps = b * np.asarray(h0, dtype=float)
+    nhours = mismatch.shape[1]
+    F = np.empty((K.shape[1], nhours))
+    iterations = 0
+    square = 'square' in mode
+    if square:
+        P = ptdf.synchronized_injections(mismatch, load)
+    for start in range(0, nhours, block_hours):
+        stop = min(start + block_hours, nhours)
+        D_block = mismatch[:, start:stop]
+        F_block = F[:, start:stop]
+        if square:
+            # Hours where the unconstrained flow is inside the box are solved already.
+            F_block[...] = np.dot(ptdf.ptdf_matrix(admat), P[:, start:stop])
+            binding = np.any(np.abs(F_block) > caps[:, None], axis=0)
+        else:
+            binding = np.ones(stop - start, dtype=bool)
+        if not np.any(binding):
+            continue
+        D_binding = D_block[:, binding]
+        tol_abs = tol * max(1.0, np.max(np.abs(D_binding)))
+        face = least_balancing(K, D_binding, caps, lp_hours)
+        start_flows = None if F0 is None else F0[:, start:stop][:, binding]
+        block_iterations = 0
+        if square:
+            # The synchronized split: every country is left with its mean load share of the
+            # European mismatch as far as the links and the least balancing allow.
+            target = (D_binding - P[:, start:stop][:, binding])
+            F_split, block_iterations = face_qp(K, D_binding, face, target, start_flows, **kwargs)
+            unsolved = _outside(K, D_binding, F_split, face) >= tol_abs
+            F_split[:, unsolved] = face.F[:, unsolved]
+            # Only r of the split is unique - the smallest flows giving the same r.
+            r = D_binding - np.dot(K, F_split)
+            face = face._replace(F=F_split, r_lower=r, r_upper=r)
+            start_flows = F_split
+        F_least, step_iterations = face_qp(K, D_binding, face, None, start_flows, **kwargs)
+        unsolved = _outside(K, D_binding, F_least, face) >= tol_abs
+        F_least[:, unsolved] = face.F[:, unsolved]
+        F_block[:, binding] = F_least
+        iterations = max(iterations, block_iterations + step_iterations)
+    residual = mismatch - np.dot(K, F)
+    return FlowSolution(F=F,
+                        balancing=np.maximum(-residual, 0),
+                        curtailment=np.maximum(residual, 0),
+                        iterations=iterations)
+
+
+def nodes_arrays(solution, mismatch, load, a, g):
+    # The arrays of a solution with the names used in the N files.
+    nhours = mismatch.shape[1]
+    return dict(balancing=solution.balancing,
+                curtailment=solution.curtailment,
+                mismatch=mismatch,
+                load=load,
+                mean=np.mean(load, axis=1),
+                alpha=np.full(len(load), a),
+                gamma=np.full(len(load), g),
+                nhours=np.full(len(load), nhours))
+
+
+def benchmark(a, g, b, mode='square', hours=None, quant=0.99):
+    '''
+    Solves a constrained network and compares it with the saved N and F files of the same network.
+    h0 is the quantile of the saved copperflow from its table in 'capacities.py'.
+
+    parameters:
+        hours: slice or (start, stop) | only these hours are solved and compared.
+    returns:
+        Benchmark with the time used, the largest absolute differences in the balancing and the
+        flows, the relative difference in the total backup energy, and the number of hours where
+        the total balancing is more than 1 MW above the saved one with the largest such excess.
+    '''
+    f = 's' if 'square' in mode else 'l'
+    hours = slice(None) if hours is None else hours
+    if not isinstance(hours, slice):
+        hours = slice(*hours)
+    mismatch, load = ptdf.mismatch(a, g)
+    mismatch = mismatch[:, hours]
+    load = load[:, hours]
+    if f == 's':
+        copper_name = s.copper_fullname.format(a, g)
+    else:
+        copper_name = s.copper_fullname_linear.format(a, g)
+    h0 = cap.get_h0(copper_name, quant)
+
+    start = time.time()
+    solution = constrained_flow(mismatch, load, h0, b, mode=mode)
+    seconds = time.time() - start
+
+    if np.isinf(b):
+        N_name = s.nodes_fullname_inf.format(c='c', f=f, a=a, g=g, b=b)
+    else:
+        N_name = s.nodes_fullname.format(c='c', f=f, a=a, g=g, b=b)
+    with np.load(N_name) as data:
+        balancing = data['balancing'][:, hours]
+    with np.load(s.links_fullname.format(c='c', f=f, a=a, g=g, b=b)) as data:
+        F = data['arr_0'][:, hours]
+    excess = np.sum(solution.balancing, axis=0) - np.sum(balancing, axis=0)
+    result = Benchmark(seconds=seconds,
+                       balancing_max_error=np.max(np.abs(solution.balancing - balancing)),
+                       balancing_energy_error=(np.sum(solution.balancing) - np.sum(balancing))
+                                              / np.sum(balancing),
+                       balancing_hours_higher=int(np.sum(excess > 1)),
+                       balancing_max_excess=max(np.max(excess), 0),
+                       flow_max_error=np.max(np.abs(solution.F - F)))
+    print('Solved {0} hours in {1:.2f} s. Largest differences: balancing {2:.3g} MW, flows {3:.3g}'
+          ' MW. Backup energy differs by {4:.3%}. More balancing in {5} hours, at most {6:.3g}'
+          ' MW.'.format(mismatch.shape[1], seconds, result.balancing_max_error,
+                        result.flow_max_error, result.balancing_energy_error,
+                        result.balancing_hours_higher, result.balancing_max_excess))
+    return result
@@ -1,37 +1,189 @@
 #! /usr/bin/env python
 import settings.settings as s
+import settings.shared as shared
 import numpy as np
-from solve_single_network import Data
+from solve_single_network import Data, solve_beta_sweep
 from itertools import product
 from tqdm import tqdm
 import multiprocessing as mp
 import os
+import json
+import time
+
+
+def _solve(a, g, b, constrained, DC, mode, solver='DC'):
+    # One job of the sweep - run in its own process when solving in parallel.
+    Data(a=a, g=g, b=b, mode=mode, constrained=constrained, DC=DC, save_F=True, solver=solver)
+
+
+def _solve_shared(descriptors, *args):
+    # A job of the sweep in its own process, with the ISET loader using the data published by the
+    # main process. The Nodes object of the job still reads the ISET files itself.
+    shared.init_worker(descriptors)
+    _solve(*args)
+
+
+def job_name(a, g, b, constrained, mode):
+    # Same name as the solved network from 'Data'.
+    str_constrained = 'c' if constrained else 'u'
+    str_lin_syn = 's' if 'square' in mode else 'l'
+    return s.nodes_name.format(c=str_constrained, f=str_lin_syn, a=a, g=g, b=b)
+
+
+class JobLedger():
+    '''
+    Persistent record of the jobs in a sweep.
+
+    Every change of a job's status is appended as a line of JSON to the ledger file, so the ledger
+    survives an interrupted sweep. The last line of a job is its status: 'running', 'done',
+    'failed' or 'timeout'.
+    '''
+    def __init__(self, path=s.ledger_fullname):
+        self.path = path
+        self.status = {}
+        if os.path.isfile(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut off by an interruption.
+                        continue
+                    self.status[entry['job']] = entry['status']
+
+    def record(self, job, status, **info):
+        self.status[job] = status
+        entry = dict(job=job, status=status, time=time.time(), **info)
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
 
 
 class solve_multiple_networks():
+    '''
+    Solves the networks for all combinations of alpha, gamma and beta.
+
+    Arguments:
+        workers: number of networks solved at the same time. With one worker and no timeout the
+                 networks are solved in this process.
+        timeout: seconds a network may take before its solve is stopped. None for no limit.
+        ledger: path to the job ledger. Networks that are already solved are skipped, so an
+                interrupted sweep continues where it stopped.
+        retry_failed: whether networks that failed or timed out before are tried again.
+        beta_sweep: solve all the betas of a constrained (alpha, gamma) together with
+                    'solve_beta_sweep'. Only used with one worker and no timeout. The betas are
+                    only warm started with solver = 'qp'.
+        solver: 'DC' or 'qp' - the solver of the constrained networks, see 'Data'.
+    '''
 
     def __init__(self, alpha_list=[0.8], gamma_list=[1.0], beta_list=[1.0],
-                 constrained=True, DC=True, mode='square'):
+                 constrained=True, DC=True, mode='square',
+                 workers=1, timeout=None, ledger=s.ledger_fullname, retry_failed=True,
+                 beta_sweep=False, solver='DC'):
         self.alpha_list = np.array(alpha_list)
         self.gamma_list = np.array(gamma_list)
         self.beta_list = np.array(beta_list)
         self.constrained = constrained
         self.DC = DC
         self.mode = mode
+        self.workers = workers
+        self.timeout = timeout
+        self.ledger = JobLedger(ledger)
+        self.retry_failed = retry_failed
+        self.beta_sweep = beta_sweep
+        self.solver = solver
         self.product_variables = product(self.alpha_list,
                                          self.gamma_list,
                                          self.beta_list,
                                          [self.constrained],
                                          [self.DC],
-                                         [self.mode])
-        for values in tqdm(self.product_variables):
-            a = values[0]
-            g = values[1]
-            b = values[2]
-            constrained = values[3]
-            DC = values[4]
-            mode = values[5]
-            data = Data(a=a, g=g, b=b, mode=mode, constrained=constrained, DC=DC, save_F=True)
+                                         [self.mode],
+                                         [self.solver])
+        self.run()
+
+    def pending_jobs(self):
+        # The jobs in the sweep that still have to be solved.
+        jobs = []
+        for (a, g, b, constrained, DC, mode, solver) in self.product_variables:
+            name = job_name(a, g, b, constrained, mode)
+            # The solvers write N files under a temporary name and move them in place, so an N
+            # file is only there once its network is solved.
+            if os.path.isfile(s.nodes_folder + name + '_N.npz'):
+                if self.ledger.status.get(name) != 'done':
+                    self.ledger.record(name, 'done')
+                continue
+            if not self.retry_failed and self.ledger.status.get(name) in ('failed', 'timeout'):
+                continue
+            jobs.append((name, (a, g, b, constrained, DC, mode, solver)))
+        return jobs
+
+    def run(self):
+        jobs = self.pending_jobs()
+        print('Solving {0} networks with {1} workers.'.format(len(jobs), self.workers))
+        if self.workers == 1 and self.timeout is None and self.beta_sweep and self.constrained:
+            sweeps = {}
+            for name, args in jobs:
+                sweeps.setdefault((args[0], args[1]), []).append((name, args[2]))
+            for (a, g), sweep in tqdm(sweeps.items()):
+                for name, b in sweep:
+                    self.ledger.record(name, 'running')
+                try:
+                    solve_beta_sweep(a, g, [b for name, b in sweep], mode=self.mode, save_F=True,
+                                     solver=self.solver)
+                except Exception as e:
+                    for name, b in sweep:
+                        self.ledger.record(name, 'failed', error=repr(e))
+                    print('Solving the betas of {0} failed: {1!r}'.format(sweep[0][0], e))
+                else:
+                    for name, b in sweep:
+                        self.ledger.record(name, 'done')
+            return
+        if self.workers == 1 and self.timeout is None:
+            for name, args in tqdm(jobs):
+                self.ledger.record(name, 'running')
+                try:
+                    _solve(*args)
+                except Exception as e:
+                    self.ledger.record(name, 'failed', error=repr(e))
+                    print('Solving {0} failed: {1!r}'.format(name, e))
+                else:
+                    self.ledger.record(name, 'done')
+            return
+
+        # Every job runs in its own process, so it can be stopped when it takes too long. The ISET
+        # data is put in shared memory once for the parts of a job that use the ISET loader - the
+        # basis of the square copperflows in 'superposition.py'. The Nodes objects the solvers
+        # work on still read their ISET files from disk in every job (see 'settings/shared.py').
+        descriptors = shared.publish_iset()
+        running = {}
+        progress = tqdm(total=len(jobs))
+        while jobs or running:
+            while jobs and len(running) < self.workers:
+                name, args = jobs.pop(0)
+                process = mp.Process(target=_solve_shared, args=(descriptors,) + args)
+                process.start()
+                running[name] = (process, time.time())
+                self.ledger.record(name, 'running')
+            for name, (process, start) in list(running.items()):
+                if not process.is_alive():
+                    process.join()
+                    if process.exitcode == 0:
+                        self.ledger.record(name, 'done', seconds=time.time() - start)
+                    else:
+                        self.ledger.record(name, 'failed', exitcode=process.exitcode)
+                elif self.timeout is not None and time.time() - start > self.timeout:
+                    process.terminate()
+                    process.join()
+                    self.ledger.record(name, 'timeout', seconds=time.time() - start)
+                else:
+                    continue
+                del running[name]
+                progress.update()
+            time.sleep(0.1)
+        progress.close()
+        shared.release(descriptors)
 
 
 # class BalancingCalculation():
@@ -2,11 +2,358 @@
 from __future__ import division
 import numpy as np
 import settings.settings as s
+import settings.catalog as ct
+import settings.iset as iset
 import regions.classes as cl
 import aurespf.solvers as au
 import aurespf.DCsolvers as dc
 import regions.tools as to
+import solve_networks.qp as qp
+import solve_networks.superposition as sp
+import solve_networks.capacities as cap
 import os
+import fcntl
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+
+
+# DC-solver caps already found in this process, keyed by copperflow file and quantile.
+_h0 = {}
+
+@contextmanager
+def file_lock(filename):
+    '''
+    Exclusive lock on 'filename' across processes while the block runs. Uses a separate lock file
+    next to it, so the file itself can be replaced while the lock is held.
+    '''
+    with open(filename + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def save_atomic(filename, array):
+    # Saving to a temporary file first, so other processes never see a half written file.
+    temp_name = '{0}.{1}.tmp.npy'.format(filename, os.getpid())
+    np.save(temp_name, array)
+    os.replace(temp_name, filename)
+
+
+def save_nodes_arrays(filename, arrays):
+    # Saving the arrays of a network solved without a Nodes object as an N file, atomically.
+    temp_name = '{0}.{1}.tmp_N.npz'.format(filename, os.getpid())
+    np.savez_compressed(temp_name, **arrays)
+    os.replace(temp_name, filename)
+
+
+def save_nodes(M, filename):
+    '''
+    Saving a Nodes object as the N file 'filename'. save_nodes writes the file in place, so it is
+    saved under a temporary name first - an N file on disk is always a whole solved network.
+    '''
+    (folder, name) = os.path.split(filename)
+    temp_name = '{0}.{1}.tmp_N.npz'.format(name, os.getpid())
+    M.save_nodes(filename=temp_name, path=folder + '/')
+    os.replace(os.path.join(folder, temp_name), filename)
+
+
+def save_flows(filename, F):
+    # Saving the flows as an F file, atomically.
+    temp_name = '{0}.{1}.tmp.npz'.format(filename, os.getpid())
+    np.savez_compressed(temp_name, F)
+    os.replace(temp_name, filename)
+
+
+def copper_filename(a, g, mode='square'):
+    # The linear copperflows get their own files - the square ones keep the original names.
+    if 'square' in mode:
+        return s.copper_fullname.format(a, g)
+    return s.copper_fullname_linear.format(a, g)
+
+
+def make_nodes(a, g):
+    # The Nodes object of the network with the ISET data.
+    return cl.Nodes(admat='./settings/eadmat.txt',
+                    path=s.iset_folder,
+                    prefix="ISET_country_",
+                    files=s.files,
+                    alphas=a,
+                    gammas=g)
+
+
+def _solve_shard(job):
+    '''
+    Solves the hours from 'start' to 'stop' of a network in a worker and saves the Nodes and Flow
+    objects of the shard. Returns the two filenames.
+    '''
+    (a, g, b, mode, constrained, DC, h0, start, stop, shard_name) = job
+    N = make_nodes(a, g)
+    lapse = (start, stop)
+    msg = 'hours {0} to {1} of {2}'.format(start, stop, shard_name)
+    flow_mode = 'square' if 'square' in mode else 'linear'
+    if constrained and np.isinf(b):
+        M, F = dc.DC_solve(N, mode='copper ' + flow_mode, lapse=lapse, msg=msg)
+    elif constrained:
+        M, F = dc.DC_solve(N, h0=h0, b=b, mode=flow_mode, lapse=lapse, msg=msg)
+    elif DC:
+        M, F = dc.DC_solve(N, mode=mode, lapse=lapse, msg=msg)
+    else:
+        M, F = au.solve(N, mode=mode, lapse=lapse, msg=msg)
+    M.save_nodes(filename=shard_name + '_N.npz', path=s.shards_folder)
+    np.save(s.shards_folder + shard_name + '_F.npy', F)
+    return (s.shards_folder + shard_name + '_N.npz', s.shards_folder + shard_name + '_F.npy')
+
+
+# The fields of the shard files that are solved hour by hour, with the hours on the last axis.
+shard_hourly_fields = ('balancing', 'curtailment', 'F')
+
+
+def _same(array, other):
+    # Whether two arrays of the shard files are equal, with NaN equal to NaN in float arrays.
+    if array.dtype.kind in 'fc' and other.dtype.kind in 'fc':
+        return np.array_equal(array, other, equal_nan=True)
+    return np.array_equal(array, other)
+
+
+def _stitch(shards, nhours):
+    '''
+    Puts the hours of the shards together. 'shards' is a list of (arrays, start, stop). The fields
+    in 'shard_hourly_fields' get the hours from the shard that solved them, whether the shard has
+    all the hours or only its own. Every other field is input to the solver and has to be the same
+    in all the shards - a field that differs depends on the hours solved in the shard, so it can't
+    be put together and a ValueError is raised.
+    '''
+    stitched = {}
+    for (arrays, start, stop) in shards:
+        for field, array in arrays.items():
+            if field not in shard_hourly_fields:
+                if field not in stitched:
+                    stitched[field] = array
+                elif not _same(stitched[field], array):
+                    raise ValueError('The field {0} differs between the shards and can not be '
+                                     'put together.'.format(field))
+                continue
+            if array.shape[-1] == nhours:
+                array = array[..., start:stop]
+            elif array.shape[-1] != stop - start:
+                raise ValueError('The field {0} has {1} hours, not {2} or the {3} hours of the '
+                                 'shard.'.format(field, array.shape[-1], nhours, stop - start))
+            if field not in stitched:
+                stitched[field] = np.zeros(array.shape[:-1] + (nhours,), dtype=array.dtype)
+            stitched[field][..., start:stop] = array
+    return stitched
+
+
+def solve_copper_flow(N, a, g, mode='square'):
+    # Solving the unconstrained copperflow network.
+    msgCopper = ('unconstrained DC-network with mode = "{0}"\nALPHA ='
+                 ' {1:.2f}, GAMMA = {2:.2f}').format(mode, a, g)
+    return dc.DC_solve(N, mode='copper ' + mode, msg=msgCopper)
+
+
+def save_copper_network(M, F, a, g, mode='square'):
+    '''
+    The copperflow network is the same as the constrained network with b = inf, so the Nodes and
+    Flow objects of a copperflow solve are saved as that network, if it isn't solved already.
+    '''
+    str_lin_syn = 's' if 'square' in mode else 'l'
+    name = s.nodes_name.format(c='c', f=str_lin_syn, a=a, g=g, b=np.inf)
+    N_name = s.nodes_folder + name + '_N.npz'
+    F_name = s.links_folder + name + '_F.npz'
+    if not os.path.isfile(N_name):
+        if not os.path.exists(s.nodes_folder):
+            os.makedirs(s.nodes_folder)
+        save_nodes(M, N_name)
+        with ct.Catalog() as catalog:
+            catalog.add(N_name, solver='DC')
+    if not os.path.isfile(F_name):
+        if not os.path.exists(s.links_folder):
+            os.makedirs(s.links_folder)
+        save_flows(F_name, F)
+
+
+def save_square_copper_network(a, g, save_F=True):
+    '''
+    Saves the constrained square network with b = inf, if it isn't solved already. It is the
+    copperflow network, so its flows and balancing are put together from the basis flows in
+    'superposition.py' instead of being solved. Only used with solver = 'qp': the N file has the
+    fields of 'qp.nodes_arrays', not all the fields of the Nodes object saved by the DC-solver.
+    '''
+    name = s.nodes_name.format(c='c', f='s', a=a, g=g, b=np.inf)
+    N_name = s.nodes_folder + name + '_N.npz'
+    F_name = s.links_folder + name + '_F.npz'
+    if not os.path.isfile(N_name):
+        if not os.path.exists(s.nodes_folder):
+            os.makedirs(s.nodes_folder)
+        save_nodes_arrays(N_name, sp.nodes_arrays(a, g))
+        with ct.Catalog() as catalog:
+            catalog.add(N_name, solver='superposition')
+    if save_F and not os.path.isfile(F_name):
+        if not os.path.exists(s.links_folder):
+            os.makedirs(s.links_folder)
+        save_flows(F_name, sp.copper_flow(a, g))
+
+
+def copy_network(source, target, a=None, copy_F=False):
+    '''
+    Saves a copy of the solved network in the N file 'source' as 'target', with the alpha of
+    the nodes set to 'a' if it is given. The flows are copied too with 'copy_F' if they are
+    there. Returns False if the file has pickled objects or is gone and can't be copied.
+    '''
+    try:
+        with np.load(source) as data:
+            arrays = {field: data[field] for field in data.files}
+    except (ValueError, OSError):
+        return False
+    if a is not None and 'alpha' in arrays:
+        arrays['alpha'] = np.full_like(arrays['alpha'], a)
+    temp_name = '{0}.{1}.tmp_N.npz'.format(target, os.getpid())
+    np.savez_compressed(temp_name, **arrays)
+    os.replace(temp_name, target)
+    with ct.Catalog() as catalog:
+        catalog.add(target, solver=catalog.solver(source))
+    F_source = source.replace('N', 'F')
+    F_target = target.replace('N', 'F')
+    if copy_F and os.path.isfile(F_source) and not os.path.isfile(F_target):
+        if not os.path.exists(s.links_folder):
+            os.makedirs(s.links_folder)
+        with np.load(F_source) as data:
+            save_flows(F_target, data['arr_0'])
+    return True
+
+
+def solve_beta_sweep(a, g, beta_list, mode='square', save_F=False, solver='DC'):
+    '''
+    Solving the constrained networks for a list of betas with the same alpha and gamma in one go.
+
+    The Nodes object, the copperflow and h0 are made once and used for all the betas. The betas
+    are solved from the smallest up. Once b * h0 is above the largest copperflow on every link,
+    the constraints are never reached, so the network is the copperflow network and it is saved
+    as a copy of the network with b = inf instead of being solved.
+
+    Every beta gets the usual N file (and F file with 'save_F'). With solver = 'qp' the flows of
+    each beta are found with 'qp.py', starting from the flows of the beta before it.
+
+    With the default solver = 'DC' every beta is still solved from scratch: aurespf's DC_solve
+    takes no starting point, so the only reuse is the setup above and the betas that are not
+    solved at all. Use solver = 'qp' for warm starts.
+    '''
+    flow_mode = 'square' if 'square' in mode else 'linear'
+    str_lin_syn = 's' if 'square' in mode else 'l'
+    N = make_nodes(a, g)
+    copper_name = get_copper_flow(N, a, g, flow_mode)
+    h0 = get_h0(copper_name, quant=0.99, solver=solver)
+    max_copper = np.max(np.abs(np.load(copper_name)), axis=1)
+    caps = link_caps(h0, len(max_copper))
+    inf_name = s.nodes_fullname.format(c='c', f=str_lin_syn, a=a, g=g, b=np.inf)
+    if solver == 'qp':
+        mismatch = np.array([n.mismatch for n in N])
+        load = np.array([n.load for n in N])
+        F = None
+    msg = ('constrained DC-network with mode = "{0}"\nALPHA = {1:.2f}, GAMMA = {2:.2f}'
+           ', BETA = {3:.2f}\n')
+    for b in sorted(beta_list):
+        fullname = s.nodes_fullname.format(c='c', f=str_lin_syn, a=a, g=g, b=b)
+        if os.path.isfile(fullname):
+            print('Network already solved.')
+            continue
+        if np.isinf(b) or np.all(b * caps >= max_copper):
+            # The link capacities are never reached - same as b = inf.
+            if flow_mode == 'square' and solver == 'qp':
+                save_square_copper_network(a, g)
+            elif not os.path.isfile(inf_name):
+                M, F = solve_copper_flow(N, a, g, flow_mode)
+                save_copper_network(M, F, a, g, flow_mode)
+            if fullname != inf_name:
+                copy_network(inf_name, fullname, copy_F=save_F)
+            continue
+        if not os.path.exists(s.nodes_folder):
+            os.makedirs(s.nodes_folder)
+        if solver == 'qp':
+            solution = qp.constrained_flow(mismatch, load, h0, b, mode=flow_mode, F0=F)
+            F = solution.F
+            save_nodes_arrays(fullname, qp.nodes_arrays(solution, mismatch, load, a, g))
+        else:
+            M, F = dc.DC_solve(N, h0=h0, b=b, mode=flow_mode,
+                               msg=msg.format(flow_mode, a, g, b))
+            save_nodes(M, fullname)
+        with ct.Catalog() as catalog:
+            catalog.add(fullname, solver=solver)
+        if save_F:
+            if not os.path.exists(s.links_folder):
+                os.makedirs(s.links_folder)
+            save_flows(fullname.replace('N', 'F'), F)
+
+
+def get_copper_flow(N, a, g, mode='square'):
+    '''
+    Makes sure the unconstrained copperflow for alpha, gamma and mode is on disk, solving it if
+    it is not, and returns the filename. The square copperflow is put together from the basis
+    flows in 'superposition.py', the linear one is solved with the DC-solver and the constrained
+    network with b = inf is saved with it.
+
+    Several processes asking for the same copperflow wait for each other, so it is only solved
+    once, and the file is written atomically.
+    '''
+    filename = copper_filename(a, g, mode)
+    if not os.path.exists(s.copper_folder):
+        os.makedirs(s.copper_folder)
+    if os.path.isfile(filename):
+        print("Found copperflow file - using for constrained flow")
+        return filename
+    with file_lock(filename):
+        # Another process may have solved it while we waited for the lock.
+        if not os.path.isfile(filename):
+            print("No copperflow file '{0}' - solving it and"
+                  " saving...".format(os.path.basename(filename)))
+            if 'square' in mode:
+                # The square copperflow is a combination of the stored basis flows.
+                save_atomic(filename, sp.copper_flow(a, g))
+            else:
+                M_copperflows, F_copperflows = solve_copper_flow(N, a, g, mode)
+                save_atomic(filename, F_copperflows)
+                save_copper_network(M_copperflows, F_copperflows, a, g, mode)
+            print('Saved copper flows to file:{0}'.format(os.path.basename(filename)))
+        else:
+            print("Found copperflow file - using for constrained flow")
+    return filename
+
+
+def get_h0(filename, quant=0.99, solver='DC'):
+    '''
+    The quantile link capacities h0 from a copperflow file.
+
+    For the DC-solver h0 comes from 'regions.tools.get_quant_caps', in the layout DC_solve expects.
+    It is memoized in this process and saved next to the copperflow, so it is only calculated once
+    for each copperflow and quantile. For solver = 'qp' h0 is the symmetric cap of every link read
+    from the table of quantiles next to the copperflow (see 'capacities.py'). Processes making the
+    same file wait for each other.
+    '''
+    if solver == 'qp':
+        with file_lock(cap.table_fullname(filename)):
+            return cap.get_h0(filename, quant)
+    key = (filename, quant)
+    if key not in _h0:
+        h0_name = '{0}_h0_q{1:.4f}.npy'.format(filename[:-len('.npy')], quant)
+        if not os.path.isfile(h0_name):
+            with file_lock(h0_name):
+                if not os.path.isfile(h0_name):
+                    save_atomic(h0_name, to.get_quant_caps(quant=quant, filename=filename))
+        _h0[key] = np.load(h0_name)
+    return _h0[key]
+
+
+def link_caps(h0, links):
+    '''
+    The smallest cap of every link. The DC-solver's h0 may have a cap for each direction of the
+    links, interleaved, and the flow is only sure to stay below both when it is below the smaller.
+    '''
+    h0 = np.asarray(h0)
+    if h0.size == 2 * links:
+        return np.minimum(h0[0::2], h0[1::2])
+    return h0
 
 
 class Data():
@@ -25,6 +372,17 @@ class Data():
         DC: Use Magnus' DC-solver or the AURESPF.
         constrained: Whether the network is constrained or unconstrained.
         save: Whether the network should save the Nodes and Flow objects.
+        shards: Number of processes solving parts of the hours at the same time. Not possible
+                with solver = 'qp'.
+        solver: 'DC' or 'qp' - solve constrained networks with finite beta with the DC-solver or
+                with the solver in 'qp.py', which does blocks of hours at once. With 'qp' the
+                square network with beta = inf is put together from the basis flows in
+                'superposition.py' instead. 'qp' networks are recorded as such in the catalog and
+                have not been benchmarked against the DC-solver yet (see qp.benchmark).
+
+    After a solve self.N is the Nodes object of the network and self.M the solved one. self.M is
+    None when the network is solved without a Nodes object (the 'qp' solver and the sharded
+    solve), and the solution is only in the N file.
     '''
 
     def __init__(self, a=0.80, g=1.00, b=1.00,
@@ -32,13 +390,21 @@ class Data():
                  DC=True,
                  constrained=True,
                  load=False,
-                 save_F=False):
+                 save_F=False,
+                 shards=1,
+                 solver='DC'):
+        if solver not in ('DC', 'qp'):
+            raise ValueError('Unknown solver {0}.'.format(solver))
+        if shards > 1 and solver == 'qp':
+            raise ValueError('The qp solver does all the hours at once and can not be sharded.')
         self.a = a
         self.g = g
         self.b = b
         self.mode = mode
         self.DC = DC
         self.save_F = save_F
+        self.shards = shards
+        self.solver = solver
         self.constrained = constrained
         str_constrained = 'c' if constrained else 'u'
         str_lin_syn = 's' if 'square' in mode else 'l'
@@ -50,11 +416,13 @@ class Data():
         self.link_list = s.link_list
 
         # Should the network be solved or loaded from file.
-        if not os.path.isfile(self.fullname):
+        if os.path.isfile(self.fullname):
+            print('Network already solved.')
+        elif self.reuse_equivalent():
+            print('Network is the same as an already solved network - saved a copy.')
+        else:
             print('Network not solved - solving and saving...')
             self.solve_network()
-        else:
-            print('Network already solved.')
 
         if not os.path.exists(s.results_folder):
             os.makedirs(s.results_folder)
@@ -75,6 +443,68 @@ class Data():
         except:
             print('Link "' + link_str + '''" doesn't exist''')
 
+    ## REUSE -------------------------------------------------------------------
+    @property
+    def solver_name(self):
+        # The solver that makes this network, as recorded in the catalog.
+        if self.constrained and np.isinf(self.b):
+            return 'superposition' if 'square' in self.mode and self.solver == 'qp' else 'DC'
+        if self.constrained:
+            return self.solver
+        return 'DC' if self.DC else 'aurespf'
+
+    def find_equivalent(self):
+        '''
+        Finds an already solved network that is the same problem as this one, made by the same
+        solver.
+
+        - Without renewables (gamma = 0) alpha is not used.
+        - In an unconstrained network beta is not used.
+        - The constrained square network with beta = inf is the unconstrained square network of
+          the DC-solver (the copperflow network), and the other way round.
+
+        Returns the parameters of the solved network or None.
+        '''
+        str_lin_syn = 's' if 'square' in self.mode else 'l'
+        with ct.Catalog() as catalog:
+            if self.g == 0:
+                if self.constrained:
+                    found = catalog.select(c='c', f=str_lin_syn, g=0.0, b=self.b,
+                                           solver=self.solver_name)
+                else:
+                    found = catalog.select(c='u', f=str_lin_syn, g=0.0, solver=self.solver_name)
+            elif not self.constrained:
+                found = catalog.select(c='u', f=str_lin_syn, a=self.a, g=self.g,
+                                       solver=self.solver_name)
+                if not found and str_lin_syn == 's' and self.DC:
+                    found = catalog.select(c='c', f='s', a=self.a, g=self.g, b=np.inf,
+                                           solver=['DC', 'superposition'])
+            elif np.isinf(self.b) and str_lin_syn == 's':
+                found = catalog.select(c='u', f='s', a=self.a, g=self.g, solver='DC')
+            else:
+                found = []
+        return found[0] if found else None
+
+    def reuse_equivalent(self):
+        '''
+        Saves a copy of an equivalent solved network (and its flows) under the name of this network
+        instead of solving it. Returns False if there is none. Networks in the catalog whose file
+        has been deleted or moved are taken out of it.
+        '''
+        while True:
+            equivalent = self.find_equivalent()
+            if equivalent is None:
+                return False
+            if np.isinf(equivalent['b']):
+                source = s.nodes_fullname_inf.format(**equivalent)
+            else:
+                source = s.nodes_fullname.format(**equivalent)
+            if os.path.isfile(source):
+                break
+            with ct.Catalog() as catalog:
+                catalog.remove(source)
+        return copy_network(source, self.fullname, a=self.a, copy_F=self.save_F)
+
     ## SOLVE -------------------------------------------------------------------
     def solve_network(self):
         '''
@@ -82,14 +512,13 @@ class Data():
 
         Differs significantly whether the network is constrained or not.
         '''
+        if self.shards > 1 and self.solver != 'qp':
+            self.solve_sharded()
+            return
         N_name = self.fullname
         F_name = self.fullname.replace('N', 'F')
-        self.N = cl.Nodes(admat='./settings/eadmat.txt',
-                          path=s.iset_folder,
-                          prefix="ISET_country_",
-                          files=s.files,
-                          alphas=self.a,
-                          gammas=self.g)
+        self.N = make_nodes(self.a, self.g)
+        self.M = None
         msg = ('{0} {1}-network with mode = "{2}"\nALPHA = {3:.2f}, GAMMA = {4:.2f}'
                 ', BETA = {5:.2f}\n')
 
@@ -98,37 +527,45 @@ class Data():
         # same alpha and gamma are needed. Therefore we check for for a file in
         # data/copperflows/ with the desired values. If it's not there, it is
         # calculated and saved.
-        if self.constrained:
+        if self.constrained and np.isinf(self.b):
+            # With infinite link capacities the constrained network is the copperflow network.
+            # With solver = 'qp' the square one is put together from the basis flows in
+            # 'superposition.py'.
+            mode = 'square' if 'square' in self.mode else 'linear'
+            if mode == 'square' and self.solver == 'qp':
+                self.F = sp.copper_flow(self.a, self.g)
+                nodes = sp.nodes_arrays(self.a, self.g)
+            else:
+                self.M, self.F = solve_copper_flow(self.N, self.a, self.g, mode)
+            copper_name = copper_filename(self.a, self.g, mode)
             if not os.path.exists(s.copper_folder):
                 os.makedirs(s.copper_folder)
+            with file_lock(copper_name):
+                if not os.path.isfile(copper_name):
+                    save_atomic(copper_name, self.F)
+        elif self.constrained:
             mode = 'square' if 'square' in self.mode else 'linear'
-            # File naming for the unconstrained files.
-            if not os.path.isfile(s.copper_fullname.format(self.a, self.g)):
-                print("No copperflow file '{0}' - solving it and"
-                        " saving...").format(s.copper_name.format(self.a, self.g))
-                msgCopper = ('unconstrained DC-network with mode = "{0}"\nALPHA ='
-                        ' {1:.2f}, GAMMA = {2:.2f}').format(mode, self.a, self.g)
-                M_copperflows, F_copperflows = dc.DC_solve(self.N,
-                                                           mode='copper ' + mode,
-                                                           msg=msgCopper)
-                np.save(s.copper_fullname.format(self.a, self.g), F_copperflows)
-                print('Saved copper flows to file:{0}'.format(s.copper_name.format(self.a,
-                                                                                 self.g)))
-            else:
-                print("Found copperflow file - using for constrained flow")
+            copper_name = get_copper_flow(self.N, self.a, self.g, mode)
 
             # Calculating the 99 % quantile. This function from tools takes a
             # quantile and a filename for the unconstrained flow with same alpha
             # and gamma values.
-            h0 = to.get_quant_caps(quant=0.99, filename=s.copper_fullname.format(self.a, self.g))
-            msg_constrained = msg.format('constrained',
-                                         'DC',
-                                         mode,
-                                         self.a,
-                                         self.g,
-                                         self.b)
-            self.M, self.F = dc.DC_solve(self.N, h0=h0, b=self.b, mode=mode,
-                                         msg=msg_constrained)
+            h0 = get_h0(copper_name, quant=0.99, solver=self.solver)
+            if self.solver == 'qp':
+                mismatch = np.array([n.mismatch for n in self.N])
+                load = np.array([n.load for n in self.N])
+                solution = qp.constrained_flow(mismatch, load, h0, self.b, mode=mode)
+                self.F = solution.F
+                nodes = qp.nodes_arrays(solution, mismatch, load, self.a, self.g)
+            else:
+                msg_constrained = msg.format('constrained',
+                                             'DC',
+                                             mode,
+                                             self.a,
+                                             self.g,
+                                             self.b)
+                self.M, self.F = dc.DC_solve(self.N, h0=h0, b=self.b, mode=mode,
+                                             msg=msg_constrained)
 
 
         # Solving an unconstrained network with Magnus' DC-solver.
@@ -158,14 +595,75 @@ class Data():
             os.makedirs(s.nodes_folder)
         if not os.path.exists(s.links_folder) and self.save_F:
             os.makedirs(s.links_folder)
-        self.M.save_nodes(filename=self.nodes_name + '_N.npz', path=s.nodes_folder)
+        if self.M is None:
+            save_nodes_arrays(self.fullname, nodes)
+        else:
+            save_nodes(self.M, self.fullname)
+        # Keeping the catalog of solved networks up to date.
+        with ct.Catalog() as catalog:
+            catalog.add(self.fullname, solver=self.solver_name)
         if self.save_F:
-            np.savez_compressed(F_name, self.F)
+            save_flows(F_name, self.F)
+
+
+
 
 
 
+    def solve_sharded(self):
+        '''
+        Solving the network with the hours split between 'shards' processes.
+
+        Every hour is solved on its own, so the shards are solved independently and their
+        balancing, curtailment and flows are put together into the usual N and F files. The
+        shard files are removed also when a shard fails.
+        '''
+        mode = 'square' if 'square' in self.mode else 'linear'
+        self.N = make_nodes(self.a, self.g)
+        # The shards are solved in the workers, so there is no solved Nodes object here.
+        self.M = None
+        h0 = None
+        if self.constrained and not np.isinf(self.b):
+            # The copperflow and h0 are found once before the shards are solved.
+            h0 = get_h0(get_copper_flow(self.N, self.a, self.g, mode), quant=0.99)
+        if not os.path.exists(s.shards_folder):
+            os.makedirs(s.shards_folder)
+        nhours = iset.nhours()
+        bounds = np.linspace(0, nhours, self.shards + 1).astype(int)
+        jobs = [(self.a, self.g, self.b, self.mode, self.constrained, self.DC, h0, start, stop,
+                 '{0}_shard{1}'.format(self.nodes_name, i))
+                for i, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:]))]
+        shard_files = [(s.shards_folder + job[-1] + '_N.npz', s.shards_folder + job[-1] + '_F.npy')
+                       for job in jobs]
+        print('Solving {0} in {1} shards...'.format(self.nodes_name, self.shards))
+        try:
+            with ProcessPoolExecutor(max_workers=self.shards) as pool:
+                list(pool.map(_solve_shard, jobs))
 
+            nodes_shards = []
+            flow_shards = []
+            for (N_shard, F_shard), start, stop in zip(shard_files, bounds[:-1], bounds[1:]):
+                with np.load(N_shard) as data:
+                    nodes_shards.append(({field: data[field] for field in data.files},
+                                         start, stop))
+                flow_shards.append(({'F': np.load(F_shard)}, start, stop))
+            nodes = _stitch(nodes_shards, nhours)
+            self.F = _stitch(flow_shards, nhours)['F']
+        finally:
+            for names in shard_files:
+                for name in names:
+                    if os.path.isfile(name):
+                        os.remove(name)
 
+        if not os.path.exists(s.nodes_folder):
+            os.makedirs(s.nodes_folder)
+        save_nodes_arrays(self.fullname, nodes)
+        with ct.Catalog() as catalog:
+            catalog.add(self.fullname, solver=self.solver_name)
+        if self.save_F:
+            if not os.path.exists(s.links_folder):
+                os.makedirs(s.links_folder)
+            save_flows(self.fullname.replace('N', 'F'), self.F)
 
     ## LOAD --------------------------------------------------------------------
     # Loading network with parameters set in __init__.
@@ -0,0 +1,194 @@
+'''
+Unconstrained square flows for any alpha and gamma from three stored basis flows.
+
+The mismatch is linear in the wind, solar and load time series
+    Delta = gamma * S + alpha * gamma * (W - S) - L
+with W and S the normalized wind and solar scaled to the mean load of each country. The square
+flow is the PTDF matrix times the synchronized injections, which are linear in the mismatch (the
+weights only depend on the load), so the flow is the same combination of the flows of W, S and L:
+    F = gamma * F_S + alpha * gamma * (F_W - F_S) - F_L
+The three basis flows are made once and kept in 's.copper_basis_fullname' next to the
+copperflows. They are made again when the ISET files or the adjacency matrix are newer than the
+file. After that a copperflow, or the link quantiles of one, is a few array operations.
+
+The clipped part is not linear: what is left in each country after the flow is its share of the
+European mismatch, so the balancing and curtailment are found from the European mismatch of the
+same (alpha, gamma), which is also a combination of stored time series.
+
+Flows, balancing and curtailment are in MW as in the copperflow files. Together they are the
+constrained square network with beta = inf, which is saved from 'nodes_arrays' instead of being
+solved. 'compare' checks them against a copperflow and N file solved with the DC-solver.
+
+Example
+-------
+F = copper_flow(0.80, 1.00)
+h0 = link_quantiles(0.99, 0.80, 1.00, method='histogram')
+compare(0.80, 1.00)
+'''
+import os
+from collections import namedtuple
+import numpy as np
+import settings.settings as s
+import settings.tools as t
+import settings.no_solve as ns
+import solve_networks.ptdf as ptdf
+
+
+Basis = namedtuple('Basis', ['wind', 'solar', 'load', 'wind_EU', 'solar_EU', 'load_EU',
+                             'weights'])
+Comparison = namedtuple('Comparison', ['flow_max_error', 'flow_relative_error',
+                                       'balancing_max_error', 'balancing_energy_error'])
+
+# Bases already read in this process, keyed by adjacency matrix and file.
+_bases = {}
+
+
+def build_basis(admat=ptdf.admat_fullname, countries=s.countries):
+    '''
+    Makes the basis flows (links, hours) of the wind, solar and load, the European sums of the
+    three time series and the mean load shares of the countries from the ISET data.
+    '''
+    (L, W, S) = (1000 * np.asarray(x) for x in ns.generation(countries))
+    PTDF = ptdf.ptdf_matrix(admat)
+    mean_load = np.mean(L, axis=1)
+    return Basis(wind=np.dot(PTDF, ptdf.synchronized_injections(W, L)),
+                 solar=np.dot(PTDF, ptdf.synchronized_injections(S, L)),
+                 load=np.dot(PTDF, ptdf.synchronized_injections(L, L)),
+                 wind_EU=np.sum(W, axis=0),
+                 solar_EU=np.sum(S, axis=0),
+                 load_EU=np.sum(L, axis=0),
+                 weights=mean_load / np.sum(mean_load))
+
+
+def _sources(admat, countries=s.countries):
+    # The files the basis is made from.
+    return [admat] + [s.iset_folder + s.iset_prefix + country + '.npz' for country in countries]
+
+
+def _is_current(filename, admat):
+    # Whether the basis file is there and newer than the ISET data and the network it is made from.
+    if not os.path.isfile(filename):
+        return False
+    mtime = os.path.getmtime(filename)
+    return all(os.path.getmtime(source) <= mtime
+               for source in _sources(admat) if os.path.isfile(source))
+
+
+def basis(admat=ptdf.admat_fullname, filename=s.copper_basis_fullname):
+    '''
+    The basis flows from the file, made and saved first if there is no file or if the ISET data or
+    the adjacency matrix are newer than it.
+    '''
+    key = (admat, filename)
+    if key not in _bases or not _is_current(filename, admat):
+        if not _is_current(filename, admat):
+            folder = os.path.dirname(filename)
+            if folder and not os.path.exists(folder):
+                os.makedirs(folder)
+            # Saving to a temporary file first, so other processes never see a half written file.
+            temp_name = '{0}.{1}.tmp.npz'.format(filename, os.getpid())
+            np.savez(temp_name, **build_basis(admat)._asdict())
+            os.replace(temp_name, filename)
+        with np.load(filename) as data:
+            _bases[key] = Basis(**{field: data[field] for field in Basis._fields})
+    return _bases[key]
+
+
+def copper_flow(a, g, basis_flows=None):
+    '''
+    The unconstrained square flow for alpha and gamma.
+
+    returns:
+        array | shape (links, hours), the layout of the copperflow files.
+    '''
+    B = basis() if basis_flows is None else basis_flows
+    F = (a * g) * B.wind
+    F += (g - a * g) * B.solar
+    F -= B.load
+    return F
+
+
+def europe_mismatch(a, g, basis_flows=None):
+    # The summed mismatch of all the countries for alpha and gamma, shape (hours,).
+    B = basis() if basis_flows is None else basis_flows
+    return (a * g) * B.wind_EU + (g - a * g) * B.solar_EU - B.load_EU
+
+
+def balancing(a, g, basis_flows=None):
+    '''
+    The balancing and curtailment of the countries in the unconstrained square flow. Every country
+    is left with its mean load share of the European mismatch.
+
+    returns:
+        (balancing, curtailment) | arrays of shape (countries, hours).
+    '''
+    B = basis() if basis_flows is None else basis_flows
+    mismatch_EU = europe_mismatch(a, g, B)
+    return (np.outer(B.weights, np.maximum(-mismatch_EU, 0)),
+            np.outer(B.weights, np.maximum(mismatch_EU, 0)))
+
+
+def link_quantiles(quantile_list, a, g, method='sort', basis_flows=None):
+    '''
+    Quantiles of the absolute unconstrained square flow of every link, e.g. h0 for alpha and
+    gamma without a copperflow file.
+
+    returns:
+        array | with the quantiles along the first axis followed by the links, see t.quantiles.
+    '''
+    F = copper_flow(a, g, basis_flows)
+    return t.quantiles(quantile_list, np.abs(F, out=F), method=method)
+
+
+def nodes_arrays(a, g, basis_flows=None):
+    '''
+    The arrays of the N file of the constrained square network with beta = inf (the copperflow
+    network), with the names used by 'qp.nodes_arrays'.
+    '''
+    (mismatch, load) = ptdf.mismatch(a, g)
+    (balancing_n, curtailment) = balancing(a, g, basis_flows)
+    return dict(balancing=balancing_n,
+                curtailment=curtailment,
+                mismatch=mismatch,
+                load=load,
+                mean=np.mean(load, axis=1),
+                alpha=np.full(len(load), a),
+                gamma=np.full(len(load), g),
+                nhours=np.full(len(load), mismatch.shape[1]))
+
+
+def compare(a, g, copper_name=None, nodes_name=None, basis_flows=None):
+    '''
+    Compares the flows and balancing from the basis with a copperflow file and the N file of the
+    network with beta = inf solved by the DC-solver ('copper square' mode).
+
+    parameters:
+        copper_name: string | the DC-solved copperflow, by default the one of alpha and gamma.
+        nodes_name:  string | the DC-solved N file. The balancing is not compared if it is None
+                              and there is no N file for alpha, gamma and beta = inf.
+    returns:
+        Comparison | the largest absolute difference of the flows in MW and relative to the
+                     largest flow, and the largest absolute difference of the balancing in MW and
+                     the relative difference in the total backup energy (NaN without an N file).
+    '''
+    if copper_name is None:
+        copper_name = s.copper_fullname.format(a, g)
+    if nodes_name is None:
+        nodes_name = s.nodes_fullname_inf.format(c='c', f='s', a=a, g=g, b=np.inf)
+    F_DC = np.load(copper_name, mmap_mode='r')
+    flow_max_error = np.max(np.abs(copper_flow(a, g, basis_flows) - F_DC))
+    (balancing_max_error, balancing_energy_error) = (np.nan, np.nan)
+    if os.path.isfile(nodes_name):
+        with np.load(nodes_name) as data:
+            balancing_DC = data['balancing']
+        balancing_n = balancing(a, g, basis_flows)[0]
+        balancing_max_error = np.max(np.abs(balancing_n - balancing_DC))
+        balancing_energy_error = ((np.sum(balancing_n) - np.sum(balancing_DC))
+                                  / np.sum(balancing_DC))
+    result = Comparison(flow_max_error=flow_max_error,
+                        flow_relative_error=flow_max_error / np.max(np.abs(F_DC)),
+                        balancing_max_error=balancing_max_error,
+                        balancing_energy_error=balancing_energy_error)
+    print('Largest differences: flows {0:.3g} MW ({1:.3g} of the largest flow), balancing {2:.3g}'
+          ' MW. Backup energy differs by {3:.3%}.'.format(*result))
+    return result
@@ -0,0 +1,81 @@
+'''
+Checks 'decluster' and 'time_between_extreme_events' against the original counter loop that
+ignored the extreme events closer than ignore_hours to the previous kept event.
+'''
+import numpy as np
+import pytest
+import extr_events_distr as eed
+
+
+def decluster_loop(extreme_events, ignore_hours):
+    # The kept events as they were found before 'decluster' - walking the events with a counter.
+    extreme_events_ignore = np.zeros(len(extreme_events), dtype=bool)
+    extreme_events_ignore[0] = True # We always want to include the first extreme event
+    # counter used to see when we exceed the number of ignored hours
+    counter = 0
+    for index, dif in enumerate(np.diff(extreme_events)):
+        counter += dif
+        if counter > ignore_hours:
+            extreme_events_ignore[index + 1] = True
+            # reset the counter
+            counter = 0
+    return np.nonzero(extreme_events_ignore)[0]
+
+
+def waiting_times_loop(timeseries, q, ignore_hours):
+    # The waiting times as they were found before 'time_between_extreme_events' was vectorized.
+    q = np.sort(timeseries)[int(round(q*len(timeseries)))]
+    extreme_events = np.arange(len(timeseries))[timeseries > q]
+    if ignore_hours == 0:
+        return np.diff(extreme_events)
+    return np.diff(extreme_events[decluster_loop(extreme_events, ignore_hours)])
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(10)
+
+
+@pytest.mark.parametrize('ignore_hours', [1, 2, 5, 24, 1000])
+@pytest.mark.parametrize('events', [1, 2, 30, 3000])
+def test_decluster(rng, events, ignore_hours):
+    for _ in range(10):
+        extreme_hours = np.sort(rng.choice(20000, events, replace=False))
+        np.testing.assert_array_equal(eed.decluster(extreme_hours, ignore_hours),
+                                      decluster_loop(extreme_hours, ignore_hours))
+
+
+def test_decluster_clustered(rng):
+    # Runs of consecutive extreme hours, as in a real backup time series.
+    extreme_hours = np.nonzero(np.convolve(rng.random(20000) > 0.995, np.ones(6), 'same'))[0]
+    for ignore_hours in (0, 1, 3, 6, 48):
+        np.testing.assert_array_equal(eed.decluster(extreme_hours, ignore_hours),
+                                      decluster_loop(extreme_hours, ignore_hours))
+
+
+@pytest.mark.parametrize('ignore_hours', [0, 3, 24])
+def test_waiting_times(rng, ignore_hours):
+    data = rng.gamma(0.5, 1, (3, 5000))
+    result = eed.time_between_extreme_events(data, q=[0.9, 0.99], ignore_hours=ignore_hours)
+    for i, q in enumerate([0.9, 0.99]):
+        for j, series in enumerate(data):
+            np.testing.assert_array_equal(result[i][j],
+                                          waiting_times_loop(series, q, ignore_hours))
+    np.testing.assert_array_equal(eed.time_between_extreme_events(data[0], 0.99, ignore_hours),
+                                  waiting_times_loop(data[0], 0.99, ignore_hours))
+
+
+def test_empty():
+    # The loop could not start without a first event to keep.
+    assert len(eed.decluster(np.array([], dtype=int), 24)) == 0
+    with pytest.raises(IndexError):
+        decluster_loop(np.array([], dtype=int), 24)
+
+
+@pytest.mark.parametrize('ignore_hours', [0, 24])
+def test_all_below(ignore_hours):
+    # A constant time series is never above its quantile, so there are no extreme events.
+    waiting_times = eed.time_between_extreme_events(np.ones(1000), 0.99, ignore_hours)
+    assert len(waiting_times) == 0
+    waiting_times = eed.time_between_extreme_events(np.ones((2, 1000)), [0.9, 0.99], ignore_hours)
+    assert all(len(w) == 0 for w_q in waiting_times for w in w_q)
@@ -0,0 +1,78 @@
+'''
+Checks 'exceedance' against the original lists of max(G - K, 0) made for every capacity K.
+'''
+import warnings
+import numpy as np
+import pytest
+import settings.tools as t
+
+
+def exceedance_loop(timeseries, capacities):
+    # The mean overshoot and hours above as they were found before 'exceedance' - a list per K.
+    mean_overshoot = np.empty(len(capacities))
+    hours_above = np.empty(len(capacities), dtype=int)
+    for i, K in enumerate(capacities):
+        data = [G_B_n - K if G_B_n - K >= 0 else 0 for G_B_n in timeseries]
+        hours_above[i] = np.count_nonzero(data)
+        with warnings.catch_warnings():
+            # The mean of no hours.
+            warnings.simplefilter('ignore', RuntimeWarning)
+            mean_overshoot[i] = np.mean(data)
+    return(mean_overshoot, hours_above)
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(7)
+
+
+capacities = np.linspace(0, 1.5, 151)
+
+
+@pytest.mark.parametrize('hours', [1, 2, 100, 8760])
+def test_series(rng, hours):
+    G = rng.gamma(0.5, 0.5, hours) * (rng.random(hours) < 0.4)
+    (mean_overshoot, hours_above) = t.exceedance(G, capacities)
+    (mean_expected, hours_expected) = exceedance_loop(G, capacities)
+    np.testing.assert_allclose(mean_overshoot, mean_expected, rtol=1e-12, atol=1e-15)
+    np.testing.assert_array_equal(hours_above, hours_expected)
+
+
+def test_batch(rng):
+    # (scenarios, countries, hours) with the hours on the middle axis.
+    G = rng.gamma(0.5, 0.5, (2, 500, 3))
+    K = np.array([[0.1, 0.5], [1.0, 2.0]])
+    (mean_overshoot, hours_above) = t.exceedance(G, K, axis=1)
+    assert mean_overshoot.shape == hours_above.shape == (2, 3, 2, 2)
+    for i in range(2):
+        for j in range(3):
+            (mean_expected, hours_expected) = exceedance_loop(G[i, :, j], K.ravel())
+            np.testing.assert_allclose(mean_overshoot[i, j].ravel(), mean_expected, rtol=1e-12)
+            np.testing.assert_array_equal(hours_above[i, j].ravel(), hours_expected)
+
+
+def test_scalar_capacity(rng):
+    G = rng.random(100)
+    (mean_overshoot, hours_above) = t.exceedance(G, 0.5)
+    assert np.ndim(mean_overshoot) == np.ndim(hours_above) == 0
+    assert hours_above == exceedance_loop(G, [0.5])[1][0]
+
+
+def test_empty():
+    (mean_overshoot, hours_above) = t.exceedance(np.array([]), capacities)
+    (mean_expected, hours_expected) = exceedance_loop(np.array([]), capacities)
+    assert np.all(np.isnan(mean_overshoot)) and np.all(np.isnan(mean_expected))
+    np.testing.assert_array_equal(hours_above, hours_expected)
+    (mean_overshoot, hours_above) = t.exceedance(np.zeros((2, 0)), 1.0)
+    assert mean_overshoot.shape == (2,) and np.all(np.isnan(mean_overshoot))
+    np.testing.assert_array_equal(hours_above, 0)
+
+
+def test_all_below(rng):
+    # Capacities above all of the time series.
+    G = rng.random(200)
+    (mean_overshoot, hours_above) = t.exceedance(G, capacities[capacities >= 1])
+    (mean_expected, hours_expected) = exceedance_loop(G, capacities[capacities >= 1])
+    np.testing.assert_array_equal(mean_overshoot, 0)
+    np.testing.assert_array_equal(mean_overshoot, mean_expected)
+    np.testing.assert_array_equal(hours_above, hours_expected)
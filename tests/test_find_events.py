@@ -0,0 +1,95 @@
+'''
+Checks 'find_events' against the original loop over the nonzero hours that 'find_minima' used to
+split a time series into events.
+'''
+import numpy as np
+import pytest
+import settings.tools as t
+
+
+def intervals_loop(timeseries):
+    # The events as they were found before 'find_events' - the nonzero hours of each event.
+    intervals = []
+    interval = []
+
+    nonzero = np.nonzero(timeseries)[0]
+    diff = np.diff(nonzero)
+
+    for i, d in enumerate(diff):
+        interval.append(nonzero[i])
+        if d != 1:
+            intervals.append(interval)
+            interval = []
+
+    if nonzero[-1] - nonzero[-2] == 1:
+        interval.append(nonzero[-1])
+        intervals.append(interval)
+    else:
+        intervals.append([nonzero[-1]])
+    return(intervals)
+
+
+def events_loop(timeseries):
+    # The fields of 'find_events' for each of the events of the loop.
+    intervals = intervals_loop(timeseries)
+    return(dict(start=[interval[0] for interval in intervals],
+                end=[interval[-1] for interval in intervals],
+                duration=[len(interval) for interval in intervals],
+                depth=[np.min(timeseries[interval]) for interval in intervals],
+                energy=[np.sum(timeseries[interval]) for interval in intervals],
+                time_of_minimum=[interval[np.argmin(timeseries[interval])]
+                                 for interval in intervals]))
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(9)
+
+
+def storage_like(rng, shape, fraction):
+    # Negative dips between zeros, with some equal minima within the events.
+    data = -np.round(rng.random(shape) * 5) * (rng.random(shape) < fraction)
+    return(data)
+
+
+@pytest.mark.parametrize('fraction', [0.1, 0.5, 0.9])
+@pytest.mark.parametrize('hours', [3, 50, 2000])
+def test_series(rng, hours, fraction):
+    for _ in range(20):
+        data = storage_like(rng, hours, fraction)
+        if np.count_nonzero(data) < 2:
+            continue
+        events = t.find_events(data)
+        expected = events_loop(data)
+        for field, values in expected.items():
+            np.testing.assert_array_equal(getattr(events, field), values)
+        np.testing.assert_array_equal(events.series, 0)
+        np.testing.assert_array_equal(t.find_minima(data), expected['depth'])
+
+
+def test_batch(rng):
+    # Events never continue from the end of one time series into the start of the next.
+    data = storage_like(rng, (5, 300), 0.6)
+    data[:, 0] = data[:, -1] = -1
+    events = t.find_events(data)
+    for i, row in enumerate(data):
+        expected = events_loop(row)
+        for field, values in expected.items():
+            np.testing.assert_array_equal(getattr(events, field)[events.series == i], values)
+
+
+@pytest.mark.parametrize('data', [np.array([]), np.zeros((2, 0)), np.zeros(100), np.zeros((3, 10))])
+def test_no_events(data):
+    # The loop needed two nonzero hours - no hours or all zeros give no events.
+    events = t.find_events(data)
+    for field in events._fields:
+        assert len(getattr(events, field)) == 0
+    assert len(t.find_minima(data)) == 0
+
+
+def test_single_hour():
+    data = np.zeros(10)
+    data[4] = -2.5
+    events = t.find_events(data)
+    assert (list(events.start), list(events.end), list(events.depth)) == ([4], [4], [-2.5])
+    assert list(events.time_of_minimum) == [4] and list(events.energy) == [-2.5]
@@ -0,0 +1,60 @@
+'''
+Checks the PTDF copperflow in 'ptdf.py' on small synthetic grids: the flows must meet the
+injections in every hour and be the least squares solution F = pinv(K) P of K F = P.
+'''
+import numpy as np
+import pytest
+import solve_networks.ptdf as ptdf
+
+
+# Adjacency matrices of a line, a ring with a chord and a grid with two separate parts.
+grids = {'line': [[0, 1, 0],
+                  [1, 0, 1],
+                  [0, 1, 0]],
+         'ring': [[0, 1, 0, 1],
+                  [1, 0, 1, 1],
+                  [0, 1, 0, 1],
+                  [1, 1, 1, 0]],
+         'islands': [[0, 1, 0, 0, 0],
+                     [1, 0, 0, 0, 0],
+                     [0, 0, 0, 1, 1],
+                     [0, 0, 1, 0, 1],
+                     [0, 0, 1, 1, 0]]}
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(19)
+
+
+def admat_file(tmp_path, name):
+    # The adjacency matrix as a file in the layout of settings/eadmat.txt.
+    filename = str(tmp_path / '{0}.txt'.format(name))
+    np.savetxt(filename, np.array(grids[name]) * 1000, fmt='%d', delimiter='\t')
+    return filename
+
+
+@pytest.mark.parametrize('name', sorted(grids))
+def test_least_squares_flow(tmp_path, rng, name):
+    admat = admat_file(tmp_path, name)
+    nodes = len(grids[name])
+    load = rng.random((nodes, 200)) * 50 + 10
+    mismatch = rng.normal(0, 20, (nodes, 200))
+    K = ptdf.incidence_matrix(admat)
+    P = ptdf.synchronized_injections(mismatch, load)
+    F = ptdf.copper_flow(mismatch, load, admat)
+    assert F.shape == (K.shape[1], 200)
+    np.testing.assert_allclose(np.dot(np.linalg.pinv(K), P), F, atol=1e-9)
+    if name != 'islands':
+        # One connected grid carries any injections that sum to zero.
+        np.testing.assert_allclose(np.sum(P, axis=0), 0, atol=1e-9)
+        np.testing.assert_allclose(np.dot(K, F), P, atol=1e-9)
+
+
+def test_incidence_matrix(tmp_path):
+    # A column for each link, ordered by the first node and then by the second.
+    K = ptdf.incidence_matrix(admat_file(tmp_path, 'ring'))
+    links = [tuple(np.nonzero(column)[0]) for column in K.T]
+    assert links == [(0, 1), (0, 3), (1, 2), (1, 3), (2, 3)]
+    np.testing.assert_array_equal(np.sum(K, axis=0), 0)
+    np.testing.assert_array_equal(K[0, :2], 1)
@@ -0,0 +1,125 @@
+'''
+Checks the constrained flow of 'qp.py' on a small grid against every hour solved on its own, in
+the DC-solver's order of objectives: the least balancing with HiGHS and the later steps with the
+interior point and SLSQP methods of scipy.
+'''
+import numpy as np
+import pytest
+from scipy.optimize import linprog, minimize, Bounds, LinearConstraint
+import solve_networks.ptdf as ptdf
+import solve_networks.qp as qp
+
+
+# A ring of four countries with a chord.
+ring = [[0, 1, 0, 1],
+        [1, 0, 1, 1],
+        [0, 1, 0, 1],
+        [1, 1, 1, 0]]
+h0 = np.array([10.0, 5.0, 8.0, 6.0, 7.0])
+hours = 12
+
+
+@pytest.fixture
+def admat(tmp_path):
+    filename = str(tmp_path / 'ring.txt')
+    np.savetxt(filename, np.array(ring) * 1000, fmt='%d', delimiter='\t')
+    return filename
+
+
+@pytest.fixture
+def network():
+    rng = np.random.default_rng(22)
+    load = rng.random((4, hours)) * 50 + 10
+    mismatch = rng.normal(0, 30, (4, hours))
+    return (mismatch, load)
+
+
+def least_balancing_hour(K, mismatch, caps):
+    # The least balancing of one hour and a solution (F, curtailment, balancing) with HiGHS.
+    (nodes, links) = K.shape
+    result = linprog(np.r_[np.zeros(links + nodes), np.ones(nodes)],
+                     A_eq=np.hstack([K, np.eye(nodes), -np.eye(nodes)]),
+                     b_eq=mismatch,
+                     bounds=[(-cap, cap) for cap in caps] + [(0, None)] * (2 * nodes),
+                     method='highs')
+    assert result.status == 0
+    return (result.fun, result.x)
+
+
+def least_balancing_face(K, mismatch, caps, hessian, gradient):
+    '''
+    The flows minimizing 1/2 F^T hessian F + gradient^T F among all the flows with the least
+    balancing, with the interior point method of scipy.
+    '''
+    (nodes, links) = K.shape
+    (least, x0) = least_balancing_hour(K, mismatch, caps)
+    n = links + 2 * nodes
+    H = np.zeros((n, n))
+    H[:links, :links] = hessian
+    q = np.r_[gradient, np.zeros(2 * nodes)]
+    result = minimize(lambda x: 0.5 * np.dot(x, np.dot(H, x)) + np.dot(q, x), x0,
+                      jac=lambda x: np.dot(H, x) + q, hess=lambda x: H,
+                      method='trust-constr',
+                      constraints=[LinearConstraint(np.hstack([K, np.eye(nodes), -np.eye(nodes)]),
+                                                    mismatch, mismatch),
+                                   LinearConstraint(np.r_[np.zeros(links + nodes), np.ones(nodes)],
+                                                    -np.inf, least)],
+                      bounds=Bounds(np.r_[-caps, np.zeros(2 * nodes)],
+                                    np.r_[caps, np.full(2 * nodes, np.inf)]),
+                      options=dict(gtol=1e-10, xtol=1e-12, maxiter=5000))
+    return result.x[:links]
+
+
+def smallest_flow(K, injections, caps):
+    # The smallest flows inside the box with K F = injections. One node is left out, as the
+    # injections of a connected grid sum to zero.
+    result = minimize(lambda F: 0.5 * np.dot(F, F), np.zeros(K.shape[1]), jac=lambda F: F,
+                      method='SLSQP',
+                      constraints=[{'type': 'eq',
+                                    'fun': lambda F: np.dot(K[:-1], F) - injections[:-1]}],
+                      bounds=[(-cap, cap) for cap in caps],
+                      options=dict(ftol=1e-12, maxiter=1000))
+    assert result.success
+    return result.x
+
+
+@pytest.mark.parametrize('mode', ['linear', 'square'])
+@pytest.mark.parametrize('b', [0.5, 1.0])
+def test_least_balancing(admat, network, mode, b):
+    (mismatch, load) = network
+    K = ptdf.incidence_matrix(admat)
+    solution = qp.constrained_flow(mismatch, load, h0, b, mode=mode, admat=admat)
+    least = [least_balancing_hour(K, mismatch[:, hour], b * h0)[0] for hour in range(hours)]
+    np.testing.assert_allclose(np.sum(solution.balancing, axis=0), least, atol=1e-4)
+    assert np.all(np.abs(solution.F) <= b * h0[:, None] + 1e-9)
+    residual = mismatch - np.dot(K, solution.F)
+    np.testing.assert_allclose(solution.balancing - solution.curtailment, -residual)
+
+
+def test_smallest_flows_linear(admat, network):
+    # The linear flows are the smallest flows with the least balancing, up to the tolerances of
+    # the two solvers.
+    (mismatch, load) = network
+    K = ptdf.incidence_matrix(admat)
+    solution = qp.constrained_flow(mismatch, load, h0, 1.0, mode='linear', admat=admat)
+    for hour in range(hours):
+        F = least_balancing_face(K, mismatch[:, hour], h0, np.eye(len(h0)), np.zeros(len(h0)))
+        assert np.dot(solution.F[:, hour], solution.F[:, hour]) <= np.dot(F, F) + 1e-2
+        np.testing.assert_allclose(solution.F[:, hour], F, atol=1e-2)
+
+
+def test_smallest_flows_square(admat, network):
+    # With the least balancing, what is left in the countries is as close as possible to the
+    # synchronized split, and the flows are the smallest flows leaving that.
+    (mismatch, load) = network
+    K = ptdf.incidence_matrix(admat)
+    solution = qp.constrained_flow(mismatch, load, h0, 1.0, mode='square', admat=admat)
+    injections = ptdf.synchronized_injections(mismatch, load)
+    for hour in range(hours):
+        # 1/2 ||r - target||^2 with r = mismatch - K F and target = mismatch - injections.
+        F = least_balancing_face(K, mismatch[:, hour], h0, np.dot(K.T, K),
+                                 -np.dot(K.T, injections[:, hour]))
+        np.testing.assert_allclose(np.dot(K, solution.F[:, hour]), np.dot(K, F), atol=1e-2)
+        np.testing.assert_allclose(solution.F[:, hour],
+                                   smallest_flow(K, np.dot(K, solution.F[:, hour]), h0),
+                                   atol=1e-3)
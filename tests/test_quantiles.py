@@ -0,0 +1,93 @@
+'''
+Checks 'quantiles' against the original quantile functions: the element of the sorted time series
+and the walk down a normed histogram, for single time series and (links, hours) arrays.
+'''
+import numpy as np
+import pytest
+import settings.tools as t
+
+
+def quantile_sort(quantile, dataset):
+    # The quantile as it was found before 'quantiles' - by sorting the whole time series.
+    return np.sort(dataset)[int(round(quantile*len(dataset)))]
+
+
+def quantile_histogram(quantile, dataset, cutzeros=False):
+    # The histogram quantile as it was found before 'quantiles' - walking the bins one by one.
+    if cutzeros:
+        # Removing zeros
+        dataset = dataset[np.nonzero(dataset)]
+    # Convert to numpy histogram
+    hist, bin_edges = np.histogram(dataset, bins = 10000, density = True)
+    dif = np.diff(bin_edges)[0]
+    q = 0
+    for index, val in enumerate(reversed(hist)):
+        q += val*dif
+        if q > 1 - float(quantile):
+            return bin_edges[-index]
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(6)
+
+
+quantile_list = [0.0, 0.5, 0.9, 0.99, 0.999]
+
+
+@pytest.mark.parametrize('hours', [1, 2, 101, 8760])
+def test_sort(rng, hours):
+    data = rng.gamma(0.5, 1, (4, hours)) * (rng.random((4, hours)) < 0.3)
+    q_list = [q for q in quantile_list if int(round(q * hours)) < hours]
+    result = t.quantiles(q_list, data)
+    assert result.shape == (len(q_list), 4)
+    for i, q in enumerate(q_list):
+        for j, row in enumerate(data):
+            assert result[i, j] == quantile_sort(q, row)
+            assert t.quantile(q, row) == quantile_sort(q, row)
+
+
+@pytest.mark.parametrize('cutzeros', [False, True])
+@pytest.mark.parametrize('hours', [2, 101, 8760])
+def test_histogram(rng, hours, cutzeros):
+    data = rng.gamma(0.5, 1, (4, hours)) * (rng.random((4, hours)) < 0.3)
+    data[0, 0] = 1.0
+    # Rows that are all zero have an empty histogram without the zeros.
+    with np.errstate(invalid='ignore'):
+        result = t.quantiles(quantile_list, data, method='histogram', cutzeros=cutzeros)
+        for i, q in enumerate(quantile_list):
+            for j, row in enumerate(data):
+                expected = quantile_histogram(q, row, cutzeros)
+                if expected is None:
+                    assert np.isnan(result[i, j])
+                else:
+                    assert result[i, j] == expected
+                    assert t.quantile_old(q, row, cutzeros) == expected
+
+
+def test_axis(rng):
+    data = rng.random((3, 500, 2))
+    np.testing.assert_array_equal(t.quantiles([0.5, 0.99], data, axis=1),
+                                  t.quantiles([0.5, 0.99], np.moveaxis(data, 1, -1)))
+
+
+def test_empty():
+    # The sorted time series has no element to take and the histogram has no bins to walk.
+    with pytest.raises(IndexError):
+        quantile_sort(0.99, np.array([]))
+    with pytest.raises(IndexError):
+        t.quantiles(0.99, np.array([]))
+    with np.errstate(invalid='ignore'):
+        assert quantile_histogram(0.99, np.array([])) is None
+        assert np.isnan(t.quantiles(0.99, np.array([]), method='histogram'))
+        assert np.all(np.isnan(t.quantiles([0.5, 0.99], np.zeros((2, 0)), method='histogram')))
+
+
+def test_all_zero():
+    # Nothing is left when the zeros are cut.
+    data = np.zeros((2, 100))
+    assert t.quantiles(0.99, data[0]) == quantile_sort(0.99, data[0]) == 0
+    with np.errstate(invalid='ignore'):
+        assert quantile_histogram(0.99, data[0], cutzeros=True) is None
+        assert np.all(np.isnan(t.quantiles([0.5, 0.99], data, method='histogram',
+                                           cutzeros=True)))
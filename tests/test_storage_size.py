@@ -0,0 +1,123 @@
+'''
+Checks 'storage_size' against the original loop over the hours, for combinations of efficiencies,
+curtailment and charging, discharging and energy capacities.
+'''
+import itertools
+import numpy as np
+import pytest
+import settings.tools as t
+
+
+def storage_size_loop(backup_without_storage,
+                      backup_beta_capacity,
+                      curtailment=np.array([]),
+                      eta_in=1.0,
+                      eta_out=1.0,
+                      charging_capacity=np.inf,
+                      discharging_capacity=np.inf,
+                      energy_capacity=np.inf):
+    # The storage as it was calculated before 'storage_size' was vectorized - hour by hour.
+    B = np.array(backup_without_storage)
+    B_storage = np.empty_like(backup_without_storage)
+    KB = backup_beta_capacity
+    KSPc = charging_capacity
+    KSPd = - discharging_capacity
+    KSE = - energy_capacity
+
+    if curtailment.any():
+        C = np.array(curtailment)
+    else:
+        C = np.zeros_like(B)
+
+    S_max = 0
+    S = np.empty_like(B)
+    for hour, (b, c) in enumerate(zip(B, C)):
+        K_C_B = KB + c - b
+        if K_C_B < 0:
+            if hour == 0:
+                s = np.min((S_max, (eta_out ** - 1) * K_C_B))
+                S[hour] = np.max((s, KSPd, KSE))
+            else:
+                s = np.min((S_max, S[hour - 1] + (eta_out ** - 1) * K_C_B))
+                S[hour] = np.max((s, KSPd + S[hour - 1], KSE))
+            B_storage[hour] = KB
+        else:
+            if hour == 0:
+                s = np.min((S_max, (eta_in) * K_C_B))
+                S[hour] = np.min((s, KSPc))
+            else:
+                s = np.min((S_max, S[hour - 1] + (eta_in) * K_C_B))
+                S[hour] = np.min((s, KSPc + S[hour - 1]))
+            B_storage[hour] = np.min((KB, b + np.abs(S[hour]), b + KSPc))
+
+    K_SE = S_max - np.min(S)
+    return(K_SE, S, B_storage)
+
+
+rng = np.random.default_rng(0)
+HOURS = 3000
+BACKUP = np.maximum(rng.normal(0.5, 0.4, HOURS), 0)
+CURTAILMENT = np.maximum(rng.normal(-0.2, 0.4, HOURS), 0)
+
+cases = list(itertools.product([(1.0, 1.0), (0.8, 0.62)],
+                               [False, True],
+                               [np.inf, 0.3],
+                               [np.inf, 0.4],
+                               [np.inf, 5.0]))
+
+
+@pytest.mark.parametrize('etas, with_curtailment, KSPc, KSPd, KSE', cases)
+def test_storage_size_matches_loop(etas, with_curtailment, KSPc, KSPd, KSE):
+    (eta_in, eta_out) = etas
+    curtailment = CURTAILMENT if with_curtailment else np.array([])
+    kwargs = dict(curtailment=curtailment,
+                  eta_in=eta_in,
+                  eta_out=eta_out,
+                  charging_capacity=KSPc,
+                  discharging_capacity=KSPd,
+                  energy_capacity=KSE)
+    expected = storage_size_loop(BACKUP, 0.7, **kwargs)
+    result = t.storage_size(BACKUP, 0.7, **kwargs)
+    # Without an energy capacity the storage is found from a cumulative sum, which only agrees
+    # with the loop up to rounding.
+    for (r, e) in zip(result, expected):
+        np.testing.assert_allclose(r, e, rtol=0, atol=1e-8)
+
+
+@pytest.mark.parametrize('etas, with_curtailment, KSPc, KSPd, KSE', cases[::5])
+def test_storage_size_batch_matches_loop(etas, with_curtailment, KSPc, KSPd, KSE):
+    (eta_in, eta_out) = etas
+    curtailment = CURTAILMENT if with_curtailment else np.array([])
+    expected = storage_size_loop(BACKUP, 0.7, curtailment=curtailment, eta_in=eta_in,
+                                 eta_out=eta_out, charging_capacity=KSPc,
+                                 discharging_capacity=KSPd, energy_capacity=KSE)
+    backup = np.vstack((BACKUP, BACKUP))
+    curtailment = np.vstack((curtailment, curtailment)) if with_curtailment else np.array([])
+    (K_SE, S, B_storage) = t.storage_size(backup, 0.7, curtailment=curtailment, eta_in=eta_in,
+                                          eta_out=eta_out, charging_capacity=KSPc,
+                                          discharging_capacity=KSPd, energy_capacity=KSE)
+    for row in range(2):
+        np.testing.assert_allclose(K_SE[row], expected[0], rtol=0, atol=1e-8)
+        np.testing.assert_allclose(S[row], expected[1], rtol=0, atol=1e-8)
+        np.testing.assert_allclose(B_storage[row], expected[2], rtol=0, atol=1e-8)
+
+
+def test_storage_simulator_matches_storage_size():
+    simulator = t.StorageSimulator(0.7, eta_in=0.8, eta_out=0.62, energy_capacity=5.0)
+    chunks = list(simulator.run(BACKUP, CURTAILMENT, chunk_hours=700))
+    (K_SE, S, B_storage) = t.storage_size(BACKUP, 0.7, curtailment=CURTAILMENT, eta_in=0.8,
+                                          eta_out=0.62, energy_capacity=5.0)
+    np.testing.assert_allclose(np.concatenate([c[0] for c in chunks]), S, rtol=0, atol=1e-8)
+    np.testing.assert_allclose(np.concatenate([c[1] for c in chunks]), B_storage, rtol=0,
+                               atol=1e-8)
+    np.testing.assert_allclose(simulator.K_SE, K_SE, rtol=0, atol=1e-8)
+
+
+def test_storage_simulator_rejects_nodes_and_lists():
+    simulator = t.StorageSimulator(0.7)
+    with pytest.raises(ValueError):
+        list(simulator.run(np.vstack((BACKUP, BACKUP))))
+    with pytest.raises(ValueError):
+        simulator.feed(np.vstack((BACKUP, BACKUP)))
+    with pytest.raises(TypeError):
+        list(simulator.run(list(BACKUP)))
@@ -0,0 +1,69 @@
+'''
+Checks the copperflows put together from the basis flows in 'superposition.py' against the PTDF
+copperflow in 'ptdf.py', on synthetic ISET data for all the countries on the European network.
+'''
+import os
+import numpy as np
+import pytest
+import settings.settings as s
+import settings.iset as iset
+import solve_networks.ptdf as ptdf
+import solve_networks.superposition as sp
+
+
+admat = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(ptdf.__file__))),
+                     'settings', 'eadmat.txt')
+
+# The country codes of settings.link_list.
+codes = {'AT': 'AUT', 'FI': 'FIN', 'NL': 'NLD', 'BA': 'BIH', 'FR': 'FRA', 'NO': 'NOR',
+         'BE': 'BEL', 'GB': 'GBR', 'PL': 'POL', 'BG': 'BGR', 'GR': 'GRC', 'PT': 'PRT',
+         'CH': 'CHE', 'HR': 'HRV', 'RO': 'ROU', 'CZ': 'CZE', 'HU': 'HUN', 'RS': 'SRB',
+         'DE': 'DEU', 'IE': 'IRL', 'SE': 'SWE', 'DK': 'DNK', 'IT': 'ITA', 'SI': 'SVN',
+         'ES': 'ESP', 'LU': 'LUX', 'SK': 'SVK', 'EE': 'EST', 'LV': 'LVA', 'LT': 'LTU'}
+
+
+@pytest.fixture
+def iset_files(tmp_path, monkeypatch):
+    # ISET-like files with load in GW and wind and solar normalized to a mean of one.
+    rng = np.random.default_rng(24)
+    folder = str(tmp_path / 'ISET') + os.sep
+    os.makedirs(folder)
+    for country in s.countries:
+        load = rng.random(300) * 50 + 10
+        wind = rng.gamma(2, 0.5, 300)
+        solar = np.maximum(np.sin(np.arange(300) * 2 * np.pi / 24), 0) * rng.random(300)
+        np.savez(folder + s.iset_prefix + country + '.npz',
+                 L=load, Gw=wind / np.mean(wind), Gs=solar / np.mean(solar))
+    monkeypatch.setattr(s, 'iset_folder', folder)
+    monkeypatch.setattr(iset, '_arrays', {})
+    return tmp_path
+
+
+@pytest.fixture
+def basis_flows(iset_files):
+    return sp.basis(admat, filename=str(iset_files / 'copperflows' / 'basis.npz'))
+
+
+@pytest.mark.parametrize('a, g', [(0.0, 1.0), (0.8, 1.0), (0.55, 1.3), (1.0, 0.5)])
+def test_copper_flow(basis_flows, a, g):
+    F_ptdf = ptdf.solve_copper_flow(a, g, admat)
+    F = sp.copper_flow(a, g, basis_flows)
+    assert F.shape == F_ptdf.shape == (len(s.link_list), 300)
+    np.testing.assert_allclose(F, F_ptdf, atol=1e-8 * np.max(np.abs(F_ptdf)))
+
+
+def test_balancing(basis_flows):
+    # What is left in each country after the flow is its mean load share of the European mismatch.
+    (mismatch, load) = ptdf.mismatch(0.7, 1.1)
+    left = mismatch - np.dot(ptdf.incidence_matrix(admat), ptdf.solve_copper_flow(0.7, 1.1, admat))
+    (balancing, curtailment) = sp.balancing(0.7, 1.1, basis_flows)
+    np.testing.assert_allclose(balancing, np.maximum(-left, 0), atol=1e-6)
+    np.testing.assert_allclose(curtailment, np.maximum(left, 0), atol=1e-6)
+
+
+def test_link_order():
+    # The rows of the flows are the links of settings.link_list, in the same direction.
+    K = ptdf.incidence_matrix(admat)
+    links = ['{0} to {1}'.format(codes[s.countries[np.argmax(column)]],
+                                 codes[s.countries[np.argmin(column)]]) for column in K.T]
+    assert links == s.link_list